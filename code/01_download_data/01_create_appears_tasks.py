@@ -8,7 +8,8 @@
 #               - MCD12Q1.006  (Land Cover Type)
 #               - MOD44B.006   (Vegetation Continuous Fields)
 #               - MOD13A3.006  (EVI)
-# Notes:    In order to create a request using the AppEEARS API you need to
+# Notes:    All the tasks are submitted in a batch with a single login. In
+#           order to create a request using the AppEEARS API you need to
 #           have an Earthdata account. If you need to register, go to:
 #           https://urs.earthdata.nasa.gov/users/new
 #           For more information about the AppEEARS API go to:
@@ -18,12 +19,12 @@ import datetime
 import json
 import os
 
-import requests
+from code.appeears import AppEEARSClient
 
 
-def create_task(task_type, task_name, dates, layers, geo, of, proj, user, pwd):
+def build_task(task_type, task_name, dates, layers, geo, of, proj):
     """
-    Creates a task using the AppEEARS API.
+    Builds a task definition for the AppEEARS API.
     :param task_type:   task type
     :param task_name:   task name
     :param dates:       start and end of the date range for which to extract
@@ -33,14 +34,9 @@ def create_task(task_type, task_name, dates, layers, geo, of, proj, user, pwd):
     :param geo:         GeoJSON object defining the spatial region of interest
     :param of:          output file type
     :param proj:        projection name
-    :param user:        Earth data username
-    :param pwd:         Earthdata password
-    :return:            task id
+    :return:            task definition
     """
-    api = 'https://lpdaacsvc.cr.usgs.gov/appeears/api'  # api url
-
-    # create task template
-    task = {
+    return {
         'task_type': task_type,
         'task_name': task_name,
         'params': {
@@ -54,19 +50,6 @@ def create_task(task_type, task_name, dates, layers, geo, of, proj, user, pwd):
         }
     }
 
-    # get token and build header
-    token = requests.post(f'{api}/login', auth=(user, pwd)).json()['token']
-    header = {'Authorization': f'Bearer {token}'}
-
-    # post a call to the API task service
-    r = requests.post(f'{api}/task', json=task, headers=header)
-
-    # check if call was successful
-    if r.status_code == 202:
-        return r.json()['task_id']
-    else:
-        raise Exception(f'Error creating task: {r.json()["message"]}')
-
 
 if __name__ == '__main__':
     # define products and layers to request
@@ -98,13 +81,21 @@ if __name__ == '__main__':
     if not os.path.exists(tasks_info_path):
         os.makedirs(tasks_info_path)
 
+    # build one task for each layer
+    tasks = []
     for lyr, dt in zip(layers, dates):
         date = datetime.datetime.today().strftime("%Y-%m-%d")
         task_name = f'MODIS_{lyr["product"]}_{date}'
+        tasks.append(build_task(task_type, task_name, [dt], [lyr], geo, of,
+                                proj))
+
+    # submit all the tasks in a batch using a single login
+    with AppEEARSClient(user, pwd, workers=len(tasks)) as client:
+        task_ids = client.create_tasks(tasks)
 
-        # create task and store task information as JSON
-        task_id = create_task(task_type, task_name, [dt], [lyr], geo, of, proj,
-                              user, pwd)
+    for task, task_id in zip(tasks, task_ids):
+        task_name = task['task_name']
+        lyr = task['params']['layers'][0]
 
         # write task information
         task_fn = f'task_{task_id}.json'
@@ -4,72 +4,191 @@
 # Author:   Marcelo Villa P.
 # Purpose:  Downloads data files from a previously created task using the
 #           AppEEARS API.
-# Notes:    If the task is not done the program will repeatedly sleep until the
-#           task is done. The program skips all non-data files such as quality
-#           files, metadata and readme like files.
+# Notes:    The status of every task is polled at the same time and, if a task
+#           is not done, the program will repeatedly sleep (backing off up to
+#           a maximum number of seconds) until the task is done. Each bundle
+#           starts downloading as soon as its task is done. The program skips
+#           all non-data files such as quality files, metadata and readme like
+#           files. Files from the same task are downloaded concurrently using
+#           a pool of workers that share the keep-alive session (and the
+#           cached token) of a single client. The number of parallel streams
+#           can be changed with the download_workers variable. Every product
+#           folder keeps a manifest with the id, name, size and checksum of
+#           its downloaded files, which is used to skip files before making
+#           any request. The program exits with an error if any task or file
+#           failed or if any file is missing or corrupted, so it can be run
+#           again to retry.
 # =============================================================================
-import cgi
+import asyncio
+import functools
+import hashlib
 import json
 import os
 import re
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-import requests
+from code.appeears import AppEEARSClient
+from code.functions import file_checksum, read_manifest, update_manifest, \
+                           verify_manifest
+from code.variables import download_workers
 
 
-def download_task(task_id, user, pwd, layers, save_to, seconds=300):
+def download_file(client, task_id, file, path):
     """
-    Downloads all the files from a specified AppEEARS task.
+    Downloads a single file from an AppEEARS task bundle. Files that already
+    exist on disk (e.g. downloaded before the manifest existed) are only
+    checked. Files are verified against the bundle's checksum and recorded in
+    the product's manifest.
+    :param client:  code.appeears.AppEEARSClient object
+    :param task_id: task id
+    :param file:    file information from the bundle API
+    :param path:    path to save the file to
+    :return:        path to the file
+    """
+    product_path, fn = os.path.split(path)
+    entry = {'file_id': file['file_id'], 'file_name': fn,
+             'size': file['file_size'], 'sha256': file['sha256']}
+
+    if os.path.exists(path) and file_checksum(path) == entry['sha256']:
+        print(f'{path} already exists.')
+    else:
+        # call the bundle API with a specific file id and download the file
+        sha256 = hashlib.sha256()
+        with client.download(task_id, file['file_id']) as dl:
+            with open(path, 'wb') as f:
+                for data in dl.iter_content(chunk_size=8192):
+                    sha256.update(data)
+                    f.write(data)
+
+        # verify file before recording it
+        if sha256.hexdigest() != entry['sha256']:
+            os.remove(path)
+            raise Exception(f'{path} does not match the bundle checksum.')
+        print(f'{path} downloaded.')
+
+    update_manifest(product_path, entry)
 
+    return path
+
+
+def download_task(client, task_id, layers, save_to, workers=1):
+    """
+    Downloads all the files from a specified AppEEARS task. Files whose size
+    and checksum match an entry in their product's manifest are skipped
+    without making any request. Failed downloads are reported without
+    stopping the rest of the files.
+
+    :param client:  code.appeears.AppEEARSClient object
     :param task_id: task id
-    :param user:    Earthdata username
-    :param pwd:     Earthdata password
     :param layers:  list of products and their respective layers
     :param save_to: path to save the products to
-    :return:        None
+    :param workers: number of files to download in parallel
+    :return:        tuple with the list of paths to the downloaded (or
+                    existing) files and the list of paths that failed
     """
-    api = 'https://lpdaacsvc.cr.usgs.gov/appeears/api'
     basenames = ['_'.join([item['product'], item['layer']]) for item in layers]
 
-    # get token and build header
-    token = requests.post(f'{api}/login', auth=(user, pwd)).json()['token']
-    header = {'Authorization': f'Bearer {token}'}
-
     # check if task is done
-    status = requests.get(f'{api}/status/{task_id}', headers=header).json()
+    status = client.status(task_id)
     if status['status'] != 'done':
         raise Exception(f'Task {task_id} is not done yet.')
 
     # call the bundle API to get the files' information
-    bundle = requests.get(f'{api}/bundle/{task_id}').json()
-    fids = [f['file_id'] for f in bundle['files']]
+    bundle = client.bundle(task_id)
 
-    for fid in fids:
-        # call the bundle API with a specific file id
-        dl = requests.get(f'{api}/bundle/{task_id}/{fid}', stream=True)
+    paths = []
+    pending = []
+    manifests = {}
+    for file in bundle['files']:
+        # check if file is a data file
+        fn = os.path.basename(file['file_name'])
+        if not fn.startswith(tuple(basenames)):
+            continue
+
+        # get product's (without version) name of the file and its folder
+        product = re.compile('([^.|-]+)').match(fn).group()
+        product_path = os.path.join(save_to, 'original', product)
+        path = os.path.join(product_path, fn)
+        paths.append(path)
+
+        # read product's manifest once and skip already downloaded files
+        if product_path not in manifests:
+            os.makedirs(product_path, exist_ok=True)
+            manifests[product_path] = read_manifest(product_path)
+        entry = manifests[product_path].get(fn, {})
+        if (entry.get('size') == file['file_size'] and
+                entry.get('sha256') == file['sha256']):
+            print(f'{path} already exists.')
+        else:
+            pending.append((file, path))
+
+    # download files using a bounded pool of workers
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(download_file, client, task_id, file, path):
+                   path for file, path in pending}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                print(f'{futures[future]} failed: {e}')
+                failed.append(futures[future])
+
+    return paths, failed
+
+
+async def wait_for_task(client, task_id, seconds=300, start=10):
+    """
+    Polls the status of an AppEEARS task until it is done. The time between
+    calls starts at the start parameter and doubles after each call until it
+    reaches the seconds parameter. Tasks that are not in progress (pending,
+    queued or processing) nor done raise an exception.
+    :param client:  code.appeears.AppEEARSClient object
+    :param task_id: task id
+    :param seconds: maximum number of seconds to sleep between calls
+    :param start:   initial number of seconds to sleep between calls
+    :return:        None
+    """
+    loop = asyncio.get_event_loop()
+    delay = min(start, seconds)
+    while True:
+        # run the blocking call in the default executor
+        info = await loop.run_in_executor(None, client.status, task_id)
+        status = info['status']
+        if status == 'done':
+            return
+        elif status not in ('pending', 'queued', 'processing'):
+            raise Exception(f'Task {task_id} is {status}.')
+        print(f'Task {task_id} is {status}. Sleeping {delay} seconds.')
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, seconds)
+
+
+async def download_tasks(client, tasks, save_to, seconds=300, workers=1):
+    """
+    Waits for several AppEEARS tasks at the same time and downloads the files
+    of each task as soon as it is done. A failed task does not stop the
+    others.
+    :param client:  code.appeears.AppEEARSClient object
+    :param tasks:   list of dictionaries with the task_id and layers keys
+    :param save_to: path to save the products to
+    :param seconds: maximum number of seconds to sleep between status calls
+    :param workers: number of files to download in parallel for each task
+    :return:        list with the result of download_task for each task or
+                    the exception raised by the task
+    """
+    loop = asyncio.get_event_loop()
 
-        # get filename and destination folder, discarding medatafiles
-        cd = dl.headers['Content-Disposition']
-        fn = os.path.basename(cgi.parse_header(cd)[1]['filename'])
+    async def wait_and_download(task_id, layers):
+        await wait_for_task(client, task_id, seconds)
+        download = functools.partial(download_task, client, task_id, layers,
+                                     save_to, workers)
+        return await loop.run_in_executor(None, download)
 
-        # check if file is a data file
-        if fn.startswith(tuple(basenames)):
-            # get product's (without version) name of the file
-            product = re.compile('([^.|-]+)').match(fn).group()
-            product_path = os.path.join(save_to, product)
-
-            # create folder if it does not exist
-            if not os.path.exists(product_path):
-                os.makedirs(product_path)
-
-            # download file (if it has not been downloaded yet)
-            path = os.path.join(save_to, 'original', product, fn)
-            if not os.path.exists(path):
-                with open(path, 'wb') as f:
-                    for data in dl.iter_content(chunk_size=8192):
-                        f.write(data)
-                print(f'{path} downloaded.')
-            else:
-                print(f'{path} already exists.')
+    coros = [wait_and_download(task['task_id'], task['layers'])
+             for task in tasks]
+    return await asyncio.gather(*coros, return_exceptions=True)
 
 
 if __name__ == '__main__':
@@ -80,11 +199,39 @@ if __name__ == '__main__':
     # define path to save the products to
     save_to = '../../data/tif/MODIS'
 
+    # read every task info
+    tasks = []
     tasks_info_filenames = os.listdir('../../data/json/appeears_tasks')
     for task_info_fn in tasks_info_filenames:
-        # read task info and download data
         with open(f'../../data/json/appeears_tasks/{task_info_fn}') as f:
-            info = json.load(f)
-            task_id = info['task_id']
-            layers = info['layers']
-        download_task(task_id, user, pwd, layers, save_to)
+            tasks.append(json.load(f))
+
+    # wait for all the tasks and download their data
+    workers = download_workers * len(tasks)
+    with AppEEARSClient(user, pwd, workers=workers) as client:
+        results = asyncio.run(download_tasks(client, tasks, save_to,
+                                             workers=download_workers))
+
+    # report failed tasks and count failed files
+    failed_tasks = 0
+    failed = 0
+    for task, result in zip(tasks, results):
+        if isinstance(result, Exception):
+            print(f'Task {task["task_id"]} failed: {result}')
+            failed_tasks += 1
+        else:
+            failed += len(result[1])
+
+    # check the integrity of every file in the products' manifests
+    bad = 0
+    original = os.path.join(save_to, 'original')
+    for product in os.listdir(original):
+        product_path = os.path.join(original, product)
+        for fn in verify_manifest(product_path):
+            print(f'{os.path.join(product_path, fn)} is missing or corrupted.')
+            bad += 1
+
+    # exit with an error so the tasks and files are retried in the next run
+    if failed_tasks or failed or bad:
+        sys.exit(f'{failed_tasks} tasks failed, {failed} files failed and '
+                 f'{bad} files are missing or corrupted.')
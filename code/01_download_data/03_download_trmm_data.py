@@ -11,26 +11,184 @@
 #           https://storm.pps.eosdis.nasa.gov/storm/data/Service.jsp?serviceName=Order
 #           and make sure to check the FTP URL box at the Script Type section
 #           before submitting the request.
+#           Files are first written to a .part file that is resumed (using
+#           HTTP Range requests or FTP REST commands) if the download is
+#           interrupted. The .part file is only renamed to its final name once
+#           its size (and the CRC of gz files) has been verified. Several
+#           files are downloaded at the same time using a pool of workers.
+#           Verified files are recorded in a manifest (name, size and
+#           checksum) that is used to skip them in later runs without making
+#           any request. The program exits with an error if any file failed
+#           or is missing or corrupted, so it can be run again to retry.
 # =============================================================================
+import ftplib
+import gzip
 import os
+import re
 import shutil
+import sys
+import urllib.error
+import urllib.parse
 import urllib.request as request
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from contextlib import closing
 
+from code.functions import file_checksum, read_manifest, update_manifest, \
+                           verify_manifest
+from code.variables import download_workers
+
+
+def fetch_ftp(url, f, offset=0):
+    """
+    Writes the content of an FTP URL to an open file, starting at a given
+    byte offset.
+    :param url:     file's URL
+    :param f:       file object opened in append mode
+    :param offset:  number of bytes already downloaded
+    :return:        total size of the remote file in bytes
+    """
+    url = urllib.parse.urlparse(url)
+    user = urllib.parse.unquote(url.username or 'anonymous')
+    pwd = urllib.parse.unquote(url.password or '')
+    with ftplib.FTP(url.hostname) as ftp:
+        ftp.login(user, pwd)
+        ftp.voidcmd('TYPE I')
+        size = ftp.size(url.path)
+        if offset < size:
+            ftp.retrbinary(f'RETR {url.path}', f.write, rest=offset or None)
+
+    return size
+
+
+def fetch_http(url, f, offset=0):
+    """
+    Writes the content of an HTTP(S) URL to an open file, starting at a given
+    byte offset.
+    :param url:     file's URL
+    :param f:       file object opened in append mode
+    :param offset:  number of bytes already downloaded
+    :return:        total size of the remote file in bytes (None if unknown)
+    """
+    req = request.Request(url, headers={'Range': f'bytes={offset}-'})
+    try:
+        with closing(request.urlopen(req)) as r:
+            if r.status == 206:
+                # partial content: get total size from the Content-Range
+                size = int(r.headers['Content-Range'].rsplit('/', 1)[1])
+            else:
+                # the server ignored the range: start from the beginning
+                f.seek(0)
+                f.truncate()
+                length = r.headers.get('Content-Length')
+                size = int(length) if length is not None else None
+            shutil.copyfileobj(r, f)
+    except urllib.error.HTTPError as e:
+        # the requested range starts at the end of the file
+        if e.code != 416:
+            raise
+        size = int(e.headers['Content-Range'].rsplit('/', 1)[1])
+
+    return size
+
+
+def verify_file(path, size=None):
+    """
+    Verifies the integrity of a file. The size is only checked when given.
+    gz files are also completely decompressed, which checks their CRC.
+    :param path:    path to the file
+    :param size:    expected size in bytes
+    :return:        True if the file passed all the checks, False otherwise
+    """
+    if size is not None and os.path.getsize(path) != size:
+        return False
+
+    if path.endswith('.gz'):
+        try:
+            with gzip.open(path, 'rb') as gz:
+                while gz.read(1 << 20):
+                    pass
+        except (OSError, EOFError):
+            return False
+
+    return True
+
 
 def download_file(url, save_to):
     """
-    Downloads a file from an URL to a specified folder. Lightly adapted from:
-    https://stackoverflow.com/a/11768443/7144368.
+    Downloads a file from an URL to a specified folder. The file is written to
+    a .part file which is resumed if it already exists and is only renamed to
+    its final name after it has been verified. The file is then recorded in
+    the folder's manifest.
     :param url:     file's URL
     :param save_to: folder to save the file to
     :return:        path to the saved file
     """
-    fn = os.path.basename(url)
+    fn = os.path.basename(urllib.parse.urlparse(url).path)
     path = os.path.join(save_to, fn)
-    with closing(request.urlopen(url)) as r:
-        with open(path, 'wb') as f:
-            shutil.copyfileobj(r, f)
+
+    # record files downloaded before the manifest existed
+    if os.path.exists(path) and verify_file(path):
+        update_manifest(save_to, {'file_id': url, 'file_name': fn,
+                                  'size': os.path.getsize(path),
+                                  'sha256': file_checksum(path)})
+        return path
+
+    # resume the download from the bytes in the partial file
+    part = f'{path}.part'
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+    fetch = fetch_ftp if url.startswith('ftp') else fetch_http
+    with open(part, 'ab') as f:
+        size = fetch(url, f, offset)
+
+    # verify the file before committing it
+    if not verify_file(part, size):
+        os.remove(part)
+        raise Exception(f'{fn} did not pass the integrity checks.')
+    os.replace(part, path)
+    update_manifest(save_to, {'file_id': url, 'file_name': fn,
+                              'size': os.path.getsize(path),
+                              'sha256': file_checksum(path)})
+
+    return path
+
+
+def download_files(urls, save_to, workers=1):
+    """
+    Downloads several files at the same time using a pool of workers. Files
+    listed in the folder's manifest are skipped without making any request.
+    Failed downloads are reported and their partial files kept so they can be
+    resumed in a later run.
+    :param urls:    list of URLs
+    :param save_to: folder to save the files to
+    :param workers: number of files to download in parallel
+    :return:        tuple with the list of paths to the saved files and the
+                    list of URLs that failed
+    """
+    # skip files that have already been downloaded
+    manifest = read_manifest(save_to)
+    paths = []
+    pending = []
+    failed = []
+    for url in urls:
+        fn = os.path.basename(urllib.parse.urlparse(url).path)
+        if fn in manifest:
+            paths.append(os.path.join(save_to, fn))
+        else:
+            pending.append(url)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(download_file, url, save_to): url
+                   for url in pending}
+        for i, future in enumerate(as_completed(futures), 1):
+            url = futures[future]
+            try:
+                paths.append(future.result())
+                print(f'[{i}/{len(futures)}] {url} downloaded.')
+            except Exception as e:
+                print(f'[{i}/{len(futures)}] {url} failed: {e}')
+                failed.append(url)
+
+    return paths, failed
 
 
 if __name__ == '__main__':
@@ -41,5 +199,15 @@ if __name__ == '__main__':
 
     # open STORM's generated .txt file and download every file
     with open('../../data/txt/ftp_url_005_201911120612.txt', 'r') as txt:
-        for url in txt:
-            download_file(url.strip(), save_to)
+        urls = [url.strip() for url in txt if re.match('(ftp|http)', url)]
+    _, failed = download_files(urls, save_to, download_workers)
+
+    # check the integrity of every file in the manifest
+    bad = verify_manifest(save_to)
+    for fn in bad:
+        print(f'{fn} is missing or corrupted.')
+
+    # exit with an error so the files are retried in the next run
+    if failed or bad:
+        sys.exit(f'{len(failed)} files failed and {len(bad)} files are '
+                 f'missing or corrupted.')
@@ -7,7 +7,9 @@
 #           confidence are summed and all the pixels that represent a non-fire
 #           pixel are assigned a value of 0. The rest of the pixels are
 #           assigned a value of 255 and represent pixels where one cannot be
-#           sure if a fire occurred or not.
+#           sure if a fire occurred or not. Every month is independent, so
+#           months are processed in parallel using a pool of processes (see
+#           the process_workers variable).
 # Notes:    Here is the description of each pixel value in the original MOD14A2
 #           product:
 #           0   not processed
@@ -21,50 +23,63 @@
 #           8   fire (nominal confidence)
 #           9   fire (high confidence)
 # =============================================================================
-import glob
 import os
-import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import gdal
 import numpy as np
 
-from code.functions import array_to_tif, doy_to_month
+from code.functions import get_catalog, process_blocks
+from code.variables import process_workers
 
 
-def pixel_classification(arr):
+def aggregate_fire_pixels(arrays):
     """
-    Reclassifies the original MOD14A2 product into three different values:
-    Non-fire pixels (pixel-value: 5) -> 0
-    Fire pixels (pixel-value: 8 & 9) -> 1
-    Other pixels                     -> NaN
-
-    The reason for other pixel values to be assigned a NaN value is that one
+    Sums fire pixels (pixel-values: 8 & 9) of several original MOD14A2
+    composites (or windows of them), one composite at a time. The result
+    follows these rules for each pixel:
+    At least one fire pixel                 -> number of fire pixels
+    Only non-fire pixels (pixel-value: 5)   -> 0
+    Otherwise                               -> 255
+
+    The reason for other pixel values to be assigned a 255 value is that one
     cannot be sure if a fire occurred in the pixel or not, whereas with non-
     fire pixels one can be sure a fire did not occur. This is useful in a
     scenario where one wants to distinguish between certain and uncertain
     pixels (e.g. when one needs presence and absence data).
 
-    :param arr: numpy array
-    :return:    numpy array
+    Only a uint8 running sum and a Boolean mask of uncertain pixels are kept
+    in memory, so memory does not grow with the number of composites.
+
+    :param arrays:  iterable of 2D numpy arrays
+    :return:        2D numpy array
     """
-    con1 = (arr == 8) | (arr == 9)  # fire pixel
-    con2 = (arr == 5)               # non-fire pixel
-    return np.where(con1, 1, np.where(con2, 0, np.nan))
+    count = uncertain = None
+    for arr in arrays:
+        if count is None:
+            count = np.zeros(arr.shape, np.uint8)
+            uncertain = np.zeros(arr.shape, np.bool_)
 
+        fire = (arr == 8) | (arr == 9)
+        count += fire
+        uncertain |= ~(fire | (arr == 5))
 
-def sum_fire_pixels(arr):
-    """
-    Sums fire pixels (pixel-value: 1) in a 3D numpy array. NaN values (i.e.
-    every original pixel value different than 5, 8 or 9) remain as NaN values.
-    Non-fire pixels (pixel-value: 0) remain as 0 except when summed with a fire
-    pixel or with a NaN pixel, in which case it turns into a NaN value.
+    count[(count == 0) & uncertain] = 255
+    return count
 
-    :param arr: 3D numpy array
-    :return:    2D numpy array
+
+def group_month(filenames, dst):
+    """
+    Creates a monthly fire sum GeoTIFF from the 8-day files of a month. The
+    files are processed window by window and the window of each file is only
+    read when it is aggregated, so only a window of one file is in memory at
+    a time.
+    :param filenames:   list of the month's 8-day GeoTIFF filenames
+    :param dst:         output GeoTIFF's file name
+    :return:            output GeoTIFF's file name
     """
-    arr = np.where((arr == 1).any(0), np.nansum(arr, 0), np.sum(arr, 0))
-    arr[np.isnan(arr)] = 255
-    return arr.astype(np.int)
+    return process_blocks(aggregate_fire_pixels, sorted(filenames), dst,
+                          gdal.GDT_UInt16, 255, lazy=True)
 
 
 if __name__ == '__main__':
@@ -74,37 +89,17 @@ if __name__ == '__main__':
     if not os.path.exists('preprocessed'):
         os.makedirs('preprocessed')
 
-    # get unique years
-    regex = re.compile('[0-9]{7}')
-    years = set([re.search(regex, fn).group(0)[:4] for fn in os.listdir('./original')])
-    years = sorted(list(years))
-
-    # read first file and get geotransform and spatial reference data
-    fn = glob.glob('original/*.tif')[0]
-    ds = gdal.Open(fn, 0)
-    sr = ds.GetProjection()
-    gt = ds.GetGeoTransform()
-    del ds
-
-    for year in years:
-        # group file names by month
-        groups = {}
-        for fn in glob.glob(f'original/*{year}*.tif'):
-            doy = re.search(regex, fn).group(0)[4:]
-            month = doy_to_month(year, doy)
-            groups.setdefault(month, []).append(fn)
-
-        for month in groups.keys():
-            mo_array = []  # store the 8-day arrays
-            for fn in groups[month]:
-                ds = gdal.Open(fn, 0)
-                array = ds.ReadAsArray()
-                mo_array.append(array)
-                del ds
-
-            # compute and save monthly array
-            mo_array = np.stack(mo_array)  # list of arrays to 3D array
-            mo_array = pixel_classification(mo_array)
-            mo_array = sum_fire_pixels(mo_array)
+    # group file names by year and month using the folder's catalog
+    groups = {}
+    for entry in get_catalog('original'):
+        key = (f'{entry["date"]:%Y}', f'{entry["date"]:%m}')
+        groups.setdefault(key, []).append(entry['path'])
+
+    # compute and save every monthly array using a pool of processes
+    with ProcessPoolExecutor(max_workers=process_workers) as executor:
+        futures = []
+        for (year, month), filenames in groups.items():
             fn = f'preprocessed/MOD14A2_{year}{month}.tif'
-            array_to_tif(mo_array, fn, sr, gt, gdal.GDT_UInt16, 255)
+            futures.append(executor.submit(group_month, filenames, fn))
+        for i, future in enumerate(as_completed(futures), 1):
+            print(f'[{i}/{len(futures)}] {future.result()} created.')
@@ -33,9 +33,9 @@ import os
 import re
 
 import gdal
-import numpy as np
 
-from code.functions import array_to_tif
+from code.functions import get_raster_info, process_blocks, reclassify
+from code.variables import umd_reclass
 
 
 def reclass(arr):
@@ -59,24 +59,7 @@ def reclass(arr):
     :param arr:   2D numpy array
     :return:      2D numpy array
     """
-
-    # get size or input array
-    y, x = arr.shape
-
-    # create a Boolean aoi_mask for each of the new values (i.e. 0 - 5)
-    con1 = np.in1d(arr, [0, 11, 13, 15]).reshape((y, x))  # val 0
-    con2 = np.in1d(arr, [1, 2, 3, 4, 5]).reshape((y, x))  # val 1
-    con3 = (arr == 8) | (arr == 9)                        # val 2
-    con4 = (arr == 6) | (arr == 7) | (arr == 10)          # val 3
-    con5 = (arr == 12) | (arr == 14)                      # val 4
-
-    # group conditions and apply the corresponding values
-    cons = [con2, con3, con4, con5]
-    reclassed_arr = np.where(con1, 0, arr)
-    for i, con in enumerate(cons, 1):
-        reclassed_arr = np.where(con, i, reclassed_arr)
-
-    return reclassed_arr
+    return reclassify(arr, umd_reclass)
 
 
 if __name__ == '__main__':
@@ -86,23 +69,16 @@ if __name__ == '__main__':
     if not os.path.exists('preprocessed'):
         os.makedirs('preprocessed')
 
-    filenames = glob.glob('original/*')
+    filenames = glob.glob('original/*.tif')
 
     for fn in filenames:
-        # read raster and get projection, geotransform and data
-        ds = gdal.Open(fn, 0)
-        sr = ds.GetProjection()
-        gt = ds.GetGeoTransform()
-        arr = ds.ReadAsArray()
-        nd_val = ds.GetRasterBand(1).GetNoDataValue()
-        del ds
-
-        # reclass array
-        reclassed_arr = reclass(arr)
+        # get NoData value
+        nd_val = get_raster_info(fn)['nodata']
 
-        # define new name and create reclassed GeoTIFF
+        # define new name and create reclassed GeoTIFF window by window
         regex = re.compile('[0-9]{7}')
         date = re.search(regex, fn).group(0)
         year = date[:4]
         new_fn = f'preprocessed/MCD12Q1_{year}.tif'
-        array_to_tif(reclassed_arr, new_fn, sr, gt, gdal.GDT_UInt16, nd_val)
+        process_blocks(lambda arrays: reclass(arrays[0]), [fn], new_fn,
+                       gdal.GDT_Byte, nd_val)
@@ -7,36 +7,48 @@
 #           rate by 24 (hours in a day) and then by the number of days in the
 #           respective month.
 # Notes:    The original data consists of compressed gz hdf files. This script
-#           decompresses the data, saves an hdf copy to the disk and the
-#           resulting products are stored as GeoTIFFs. Furthermore, original
-#           data is not properly georeferenced and lacks projection. Therefore,
-#           the data is transposed and then flipped. It finally is given a
-#           proper geotransform and projection (WGS 84). The bounding box
-#           imported from the constants module has to coincide with the
-#           bounding box specified when submitting the PPS request. If no
-#           bounding box was specified, change the line 99 to:
-#           gt = (-180, 0.25, 0, 50, 0, -0.25)
+#           reads the compressed data in place (without saving an hdf copy to
+#           the disk) and the resulting products are stored as GeoTIFFs.
+#           Drivers that cannot read through GDAL's /vsigzip/ virtual file
+#           system (e.g. HDF4) get a temporary decompressed copy that is
+#           deleted as soon as it is read. Files are processed in parallel
+#           using a pool of processes (see the process_workers variable).
+#           Furthermore, original data is not properly georeferenced and lacks
+#           projection: rows go from west to east and columns from south to
+#           north. Therefore, the data is transposed and then flipped. It
+#           finally is given a proper geotransform and projection (WGS 84).
+#           When the files are global (i.e. no bounding box was specified when
+#           submitting the PPS request), only the window covering the bounding
+#           box imported from the constants module is read. Otherwise, this
+#           bounding box has to coincide with the one specified when
+#           submitting the PPS request.
 # =============================================================================
 import glob
 import gzip
+import math
 import os
 import re
 import shutil
+import tempfile
 from calendar import monthrange
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
 
 import gdal
 import numpy as np
 import osr
 
 from code.functions import array_to_tif
-from code.variables import bbox
+from code.variables import bbox, process_workers
 
 
 def compute_accumulation(arr, date):
     """
     Computes precipitation accumulation (mm) based on precipitation rate
     (mm/hr) data. It multiplies this rate by the number of hours in a day and
-    then by the number of days in a given month.
+    then by the number of days in a given month. The computation is done
+    pixel by pixel, so arr can also be a window of the data (e.g. one of the
+    arrays yielded by code.functions.read_blocks).
 
     :param arr:     2D numpy array
     :param date:    a string formatted as 'YYYYMM' (e.g. '201704')
@@ -48,6 +60,104 @@ def compute_accumulation(arr, date):
     return arr * hours * days
 
 
+def extract_file(zipped_file, tif_folder):
+    """
+    Creates a monthly precipitation accumulation GeoTIFF from a gz hdf file.
+    Files that already exist are skipped.
+    :param zipped_file: path to the gz file
+    :param tif_folder:  folder to save the GeoTIFF to
+    :return:            path to the GeoTIFF
+    """
+    # define a new, shorter name and skip files that already exist
+    regex = re.compile('[0-9]{8}')
+    date = re.search(regex, zipped_file).group(0)[:-2]
+    tif_fn = f'3B43_{date}.tif'
+    tif_path = os.path.join(tif_folder, tif_fn)
+    if os.path.exists(tif_path):
+        return tif_path
+
+    # read precipitation data (only the bbox window for global files) from
+    # the compressed hdf file
+    with open_gz_subdataset(zipped_file) as ds:
+        if (ds.RasterYSize, ds.RasterXSize) == (1440, 400):
+            window, gt = get_window(bbox)
+            arr = ds.ReadAsArray(*window)
+        else:
+            arr = ds.ReadAsArray()
+            gt = (bbox[0], 0.25, 0, bbox[3], 0, -0.25)
+
+    # rotate data 90 degrees to the left
+    arr = np.flip(arr.T, axis=0)
+
+    # create projection
+    sr = osr.SpatialReference()
+    sr.ImportFromEPSG(4326)
+
+    # compute precipitation accumulation and save as GeoTIFF
+    arr = compute_accumulation(arr, date)
+    array_to_tif(arr, tif_path, sr.ExportToWkt(), gt, gdal.GDT_Float32, -9999)
+
+    return tif_path
+
+
+def get_window(bbox, res=0.25, west=-180, south=-50):
+    """
+    Gets the window of a global TRMM grid that covers a bounding box. The
+    window is given in the native orientation of the data (i.e. rows are
+    longitudes and columns are latitudes) so it can be passed directly to
+    ReadAsArray.
+    :param bbox:    bounding box as (min x, min y, max x, max y)
+    :param res:     grid resolution in degrees
+    :param west:    western edge of the grid
+    :param south:   southern edge of the grid
+    :return:        tuple with the window as (xoff, yoff, xsize, ysize) and
+                    the geotransform of the rotated window
+    """
+    # latitudes (native columns), clipped to the 50S - 50N grid
+    col_start = max(math.floor((bbox[1] - south) / res), 0)
+    col_end = min(math.ceil((bbox[3] - south) / res), 400)
+
+    # longitudes (native rows), clipped to the 180W - 180E grid
+    row_start = max(math.floor((bbox[0] - west) / res), 0)
+    row_end = min(math.ceil((bbox[2] - west) / res), 1440)
+
+    window = (col_start, row_start, col_end - col_start, row_end - row_start)
+    gt = (west + row_start * res, res, 0, south + col_end * res, 0, -res)
+
+    return window, gt
+
+
+@contextmanager
+def open_gz_subdataset(src, index=0):
+    """
+    Opens a subdataset of a gz hdf file without keeping a decompressed copy
+    on disk. The file is first opened in place using GDAL's /vsigzip/ virtual
+    file system. If the driver cannot read from it, the file is decompressed
+    to a temporary file which is deleted when the dataset is closed.
+    :param src:     path to the gz file
+    :param index:   subdataset index
+    :return:        gdal.Dataset object
+    """
+    gdal.PushErrorHandler('CPLQuietErrorHandler')
+    hdf_ds = gdal.Open(f'/vsigzip/{src}')
+    gdal.PopErrorHandler()
+
+    tmp = None
+    if hdf_ds is None:
+        fd, tmp = tempfile.mkstemp(suffix='.hdf')
+        os.close(fd)
+        unzip_file(src, tmp)
+        hdf_ds = gdal.Open(tmp)
+
+    try:
+        ds = gdal.Open(hdf_ds.GetSubDatasets()[index][0])
+        yield ds
+    finally:
+        ds = hdf_ds = None
+        if tmp is not None:
+            os.remove(tmp)
+
+
 def unzip_file(src, dst):
     """
     Unzips a .gz file. Based on: https://stackoverflow.com/a/44712152/7144368
@@ -64,46 +174,16 @@ if __name__ == '__main__':
     # change directory to the root of data and define folders
     os.chdir('../../data')
     gz_folder = 'hdf/TRMM/3B43/original'
-    hdf_folder = 'hdf/TRMM/3B43/extracted'
     tif_folder = 'tif/TRMM/3B43/preprocessed'
 
-    # create tif_folder and hdf_folder if they do not exist
+    # create tif_folder if it does not exist
     if not os.path.exists(tif_folder):
         os.makedirs(tif_folder)
-    if not os.path.exists(hdf_folder):
-        os.makedirs(hdf_folder)
 
-    # get all zipped files
+    # get all zipped files and extract them using a pool of processes
     zipped_files = glob.glob(os.path.join(gz_folder, '*.gz'))
-    for zipped_file in zipped_files:
-
-        # unzip file with a new, shorter name
-        regex = re.compile('[0-9]{8}')
-        date = re.search(regex, zipped_file).group(0)[:-2]
-        hdf_fn = f'3B43_{date}.hdf'
-        hdf_path = os.path.join(hdf_folder, hdf_fn)
-        if not os.path.exists(hdf_path):
-            unzip_file(zipped_file, hdf_path)
-
-        # read precipitation data from hdf file
-        hdf_ds = gdal.Open(hdf_path)
-        ds = gdal.Open(hdf_ds.GetSubDatasets()[0][0])
-        arr = ds.ReadAsArray()
-
-        # rotate data 90 degrees to the left
-        arr = np.flip(arr.T, axis=0)
-
-        # create projection and geotransform
-        sr = osr.SpatialReference()
-        sr.ImportFromEPSG(4326)
-        gt = (bbox[0], 0.25, 0, bbox[3], 0, -0.25)
-
-        # compute precipitation accumulation and save as GeoTIFF
-        arr = compute_accumulation(arr, date)
-        tif_fn = f'3B43_{date}.tif'
-        tif_path = os.path.join(tif_folder, tif_fn)
-        if not os.path.exists(tif_path):
-            array_to_tif(arr, tif_path, sr.ExportToWkt(), gt, gdal.GDT_Float32,
-                         -9999)
-
-        del hdf_ds
+    with ProcessPoolExecutor(max_workers=process_workers) as executor:
+        futures = [executor.submit(extract_file, fn, tif_folder)
+                   for fn in zipped_files]
+        for i, future in enumerate(as_completed(futures), 1):
+            print(f'[{i}/{len(futures)}] {future.result()} done.')
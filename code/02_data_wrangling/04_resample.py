@@ -4,7 +4,18 @@
 # Author:   Marcelo Villa P.
 # Purpose:  Resamples all cells of GeoTIFF files to a specified size using
 #           GDAL Warp and a specified resampling algorithm.
-# Notes:    Documentation about both GDAL Warp command line utility and its
+# Notes:    Every product is warped to the same target grid: the extent of the
+#           AOI shapefile expanded to the pixel edges of a MOD14A2 file, at
+#           MOD14A2's resolution. This way the MOD14A2 pixels are kept as they
+#           are and the prepared rasters of every product have the same
+#           origin and size, so they can be indexed with the same rows and
+#           columns. The resampled files are written as warped virtual
+#           rasters (VRT) instead of GeoTIFFs: they only store the warp
+#           definition and the actual resampling happens when they are read
+#           by the masking script, which resamples and clips in a single pass.
+#           Files are processed in parallel and GDAL's cache and warping
+#           threads are set from the code.variables module.
+#           Documentation about both GDAL Warp command line utility and its
 #           Python bindings (i.e. gdal.Warp) can be found on:
 #               * https://gdal.org/programs/gdalwarp.html
 #               * https://gdal.org/python/osgeo.gdal-module.html#Warp
@@ -13,6 +24,10 @@ import glob
 import os
 
 import gdal
+import numpy as np
+import ogr
+
+from code.functions import get_raster_info, get_warp_options, run_parallel
 
 
 def get_resolution(fn):
@@ -21,28 +36,83 @@ def get_resolution(fn):
     :param fn: GeoTIFF filename
     :return:   tuple with x and y resolutions
     """
-    ds = gdal.Open(fn, 0)
-    gt = ds.GetGeoTransform()
+    gt = get_raster_info(fn)['geotransform']
 
     return gt[1], -gt[-1]
 
 
+def get_target_bounds(shp, fn):
+    """
+    Gets the bounds of the target grid, which is the extent of a shapefile
+    expanded to the nearest pixel edges of a reference GeoTIFF. The shapefile
+    must have the same spatial reference as the GeoTIFF.
+    :param shp: path to the shapefile
+    :param fn:  reference GeoTIFF filename
+    :return:    tuple with the min x, min y, max x and max y of the grid
+    """
+    gt = get_raster_info(fn)['geotransform']
+    shp_ds = ogr.Open(shp)
+    layer = shp_ds.GetLayer()
+    min_x, max_x, min_y, max_y = layer.GetExtent()
+    del layer, shp_ds
+
+    # snap the extent to the reference's pixel edges (gt[5] is negative)
+    left = gt[0] + np.floor((min_x - gt[0]) / gt[1]) * gt[1]
+    right = gt[0] + np.ceil((max_x - gt[0]) / gt[1]) * gt[1]
+    top = gt[3] + np.floor((max_y - gt[3]) / gt[5]) * gt[5]
+    bottom = gt[3] + np.ceil((min_y - gt[3]) / gt[5]) * gt[5]
+
+    return left, bottom, right, top
+
+
+def resample_file(src, dst, bounds, x_res, y_res, algo):
+    """
+    Creates a warped virtual raster (VRT) that resamples a raster to a given
+    grid. The VRT stores the multithreaded warp options, so they are used
+    whenever it is read.
+    :param src:     source raster filename
+    :param dst:     output VRT's file name
+    :param bounds:  output bounds as (min x, min y, max x, max y)
+    :param x_res:   output x resolution
+    :param y_res:   output y resolution
+    :param algo:    resampling algorithm
+    :return:        None
+    """
+    kwargs = {
+        'format': 'VRT',
+        'outputBounds': bounds,
+        'xRes': x_res,
+        'yRes': y_res,
+        'resampleAlg': algo,
+        **get_warp_options()
+    }
+    ds = gdal.Warp(dst, os.path.abspath(src), **kwargs)
+    del ds
+
+
 if __name__ == '__main__':
     # change directory
     os.chdir('../../data/tif')
 
-    # define a sample to get properties from
+    # define a sample to get properties from and the AOI shapefile
     target_sample = glob.glob('MODIS/MOD14A2/original/*.tif')[0]
+    aoi = '../shp/aoi/TDF_biome_COL_4326.shp'
     x_res, y_res = get_resolution(target_sample)
+    bounds = get_target_bounds(aoi, target_sample)
 
     # define products to be resampled
     products = [
         {'parent': 'MODIS', 'prod': 'MCD12Q1', 'dir': 'preprocessed',
          'algo': 'mode'},
+        {'parent': 'MODIS', 'prod': 'MOD13A3', 'dir': 'original',
+         'algo': 'near'},
+        {'parent': 'MODIS', 'prod': 'MOD14A2', 'dir': 'preprocessed',
+         'algo': 'near'},
         {'parent': 'TRMM', 'prod': '3B43', 'dir': 'preprocessed',
          'algo': 'cubic'}
     ]
 
+    jobs = []
     for prod in products:
         base = os.path.join(prod['parent'], prod['prod'])
         path = os.path.join(base, prod['dir'], '*.tif')
@@ -54,14 +124,11 @@ if __name__ == '__main__':
             os.makedirs(out_path)
 
         for fn in filenames:
-            base_name = os.path.basename(fn)
-            dst_fn = os.path.join(out_path, base_name)
+            base_name = os.path.splitext(os.path.basename(fn))[0]
+            dst_fn = os.path.join(out_path, f'{base_name}.vrt')
             if not os.path.exists(dst_fn):
-                kwargs = {
-                    'format': 'GTiff',
-                    'xRes': x_res,
-                    'yRes': y_res,
-                    'resampleAlg': prod['algo']
-                }
-                ds = gdal.Warp(dst_fn, fn, **kwargs)
-                del ds
+                jobs.append((fn, dst_fn, bounds, x_res, y_res,
+                             prod['algo']))
+
+    # resample files using a pool of processes
+    run_parallel(resample_file, jobs)
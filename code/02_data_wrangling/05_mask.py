@@ -3,40 +3,85 @@
 # Date:     November, 2019
 # Author:   Marcelo Villa P.
 # Purpose:  Masks a set of GeoTIFF files with an Area Of Interest (AOI) Shape-
-#           file using GDAL Warp.
-# Notes:    Documentation about both GDAL Warp command line utility and its
-#           Python bindings (i.e. gdal.Warp) can be found on:
-#               * https://gdal.org/programs/gdalwarp.html
-#               * https://gdal.org/python/osgeo.gdal-module.html#Warp
+#           file.
+# Notes:    The AOI is rasterized only once for each distinct grid and cached
+#           (see code.functions.get_aoi_mask) before the files are dispatched
+#           to the pool of processes, which only read it. Every file is then
+#           masked by reading the window that covers the AOI and setting the
+#           pixels outside of it to NoData, which is equivalent to warping the
+#           file with the AOI as cutline and cropping it to the cutline. Every
+#           product is read from the virtual rasters (VRT) created by the
+#           resampling script, which share the same grid, so they are
+#           resampled and clipped in a single pass, the AOI is rasterized only
+#           once and only the masked GeoTIFFs (which have the same origin and
+#           size) are written to disk. Files are processed in parallel and
+#           GDAL's cache and warping threads are set from the
+#           code.variables module.
 # =============================================================================
 import glob
 import os
 
 import gdal
 
+from code.functions import array_to_tif, get_aoi_mask, get_raster_info, \
+                           read_aoi_mask, run_parallel
+
+
+def mask_file(src, dst, mask_fn):
+    """
+    Masks a raster with the (cached) rasterized version of an AOI shapefile.
+    Only the window covering the AOI is read and pixels outside of the AOI
+    are set to the raster's NoData value (or 0 if the raster has no NoData
+    value).
+    :param src:     source raster filename
+    :param dst:     output GeoTIFF's file name
+    :param mask_fn: rasterized AOI's file name (see get_aoi_mask)
+    :return:        None
+    """
+    ds = gdal.Open(src, 0)
+    band = ds.GetRasterBand(1)
+    gt = ds.GetGeoTransform()
+    mask, window = read_aoi_mask(mask_fn, gt)
+    sr = ds.GetProjection()
+    gdtype = band.DataType
+    nd = band.GetNoDataValue()
+    arr = band.ReadAsArray(*window)
+    del ds, band
+
+    # set pixels outside of the AOI to NoData
+    arr[~mask] = nd if nd is not None else 0
+
+    # compute the geotransform of the window and save the masked array
+    xoff, yoff = window[:2]
+    gt = (gt[0] + xoff * gt[1], gt[1], 0, gt[3] + yoff * gt[5], 0, gt[5])
+    array_to_tif(arr, dst, sr, gt, gdtype, nd)
+
 
 if __name__ == '__main__':
     # change directory
     os.chdir('../../data/tif')
 
-    # define mask (shapefile)
+    # define mask (shapefile) and the folder to cache its rasterized versions
     mask = '../shp/aoi/TDF_biome_COL_4326.shp'
+    cache_dir = '../shp/aoi/cache'
 
     # define products to be masked
     products = [
         {'parent': 'MODIS', 'prod': 'MCD12Q1', 'dir': 'resampled',
-         'algo': 'mode'},
-        {'parent': 'MODIS', 'prod': 'MOD13A3', 'dir': 'original',
-         'algo': 'bilinear'},
-        {'parent': 'MODIS', 'prod': 'MOD14A2', 'dir': 'preprocessed',
-         'algo': 'near'},
+         'ext': 'vrt'},
+        {'parent': 'MODIS', 'prod': 'MOD13A3', 'dir': 'resampled',
+         'ext': 'vrt'},
+        {'parent': 'MODIS', 'prod': 'MOD14A2', 'dir': 'resampled',
+         'ext': 'vrt'},
         {'parent': 'TRMM', 'prod': '3B43', 'dir': 'resampled',
-         'algo': 'cubic'}
+         'ext': 'vrt'}
     ]
 
+    jobs = []
+    masks = {}
     for prod in products:
         base = os.path.join(prod['parent'], prod['prod'])
-        path = os.path.join(base, prod['dir'], '*.tif')
+        path = os.path.join(base, prod['dir'], f'*.{prod["ext"]}')
         filenames = glob.glob(path)
 
         # create output directory if it does not exist
@@ -45,14 +90,17 @@ if __name__ == '__main__':
             os.makedirs(out_path)
 
         for fn in filenames:
-            base_name = os.path.basename(fn)
-            dst_fn = os.path.join(out_path, base_name)
-            if not os.path.exists(dst_fn):
-                kwargs = {
-                    'format': 'GTiff',
-                    'resampleAlg': prod['algo'],
-                    'cutlineDSName': mask,
-                    'cropToCutline': True
-                }
-                ds = gdal.Warp(dst_fn, fn, **kwargs)
-                del ds
+            base_name = os.path.splitext(os.path.basename(fn))[0]
+            dst_fn = os.path.join(out_path, f'{base_name}.tif')
+            if os.path.exists(dst_fn):
+                continue
+
+            # rasterize the AOI once for each distinct grid
+            info = get_raster_info(fn)
+            grid = (info['geotransform'], info['projection'], info['shape'])
+            if grid not in masks:
+                masks[grid] = get_aoi_mask(mask, info, cache_dir)
+            jobs.append((fn, dst_fn, masks[grid]))
+
+    # mask files using a pool of processes
+    run_parallel(mask_file, jobs)
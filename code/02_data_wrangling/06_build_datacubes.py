@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# =============================================================================
+# Date:     October, 2026
+# Author:   Marcelo Villa P.
+# Purpose:  Consolidates the prepared GeoTIFF files of every product into a
+#           single chunked and compressed datacube (Zarr store). The fire
+#           pixels of the monthly fire product are also stored sparsely.
+# Notes:    Each store is written next to its folder (e.g. prepared.zarr) and
+#           has the dates parsed from the files' names as time coordinates and
+#           the products' NoData values as attributes. The store is only
+#           rebuilt when the files of its folder change, and
+#           code.functions.create_data_array reads from it instead of the
+#           GeoTIFF files while it is up to date. Chunk sizes are set with the
+#           data_chunks variable. The forest proximity datacube is built by
+#           the script that creates its rasters. Fire pixels are stored as
+#           (time, row, column, number of fires) events next to the prepared
+#           folder (prepared.events.npz) and read with
+#           code.functions.read_fire_events, so fire-centred analyses do not
+#           need to load the whole (and mostly empty) fire cube.
+# =============================================================================
+import os
+
+from code.functions import build_datacube, build_fire_events
+
+if __name__ == '__main__':
+    # change directory
+    os.chdir('../../data/tif')
+
+    # define folders of the prepared products
+    folders = ['MODIS/MCD12Q1/prepared', 'MODIS/MOD13A3/prepared',
+               'MODIS/MOD14A2/prepared', 'TRMM/3B43/prepared']
+
+    for folder in folders:
+        path = build_datacube(folder)
+        print(f'{path} is up to date.')
+
+    # store fire pixels sparsely
+    path = build_fire_events('MODIS/MOD14A2/prepared')
+    print(f'{path} is up to date.')
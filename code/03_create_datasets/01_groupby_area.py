@@ -5,46 +5,70 @@
 # Purpose:  Groups fire pixels, precipitation and Enhanced Vegetation Index
 #           (EVI) data for each month. Previous 3 months average values for
 #           precipitation and EVI are also calculated.
+# Notes:    The monthly sums and pixel counts of each product are computed in
+#           a single pass and the previous months' values are derived from
+#           their cumulative sums (see get_statistics).
 # =============================================================================
 import os
 
 import numpy as np
 import pandas as pd
 
-from code.functions import create_data_array, get_nodata_value
-from code.variables import evi_scaling_factor
+from code.functions import create_data_array
+from code.variables import data_chunks, evi_scaling_factor
 
 
-def get_data_statistic(data, nd, start=0, end=None, statistic='mean'):
+def get_statistics(data, col, statistic='mean', windows=None):
     """
-    Gets a specific statistic from a (sliced) xarray DataArray.
+    Computes a statistic of the valid pixels of every month of a DataArray
+    (see code.masked) in a single pass over the data, along with the same
+    statistic for trailing windows of previous months. Trailing windows are
+    derived from the cumulative sums of the monthly sums and pixel counts,
+    so the data is not read again for each window.
     :param data:        xarray.core.dataarray.DataArray object
-    :param nd:          NoData value
-    :param start:       start in the first dimension
-    :param end:         end in the first dimension
+    :param col:         name of the column with the monthly statistic
     :param statistic:   statistic to be computed. Possible values are:
                             * 'mean'
                             * 'sum'
-    :return:            single float
+    :param windows:     dictionary with the names of the trailing windows'
+                        columns and their number of previous months (e.g.
+                        {'ppt_prev': 3}). Windows that start before the
+                        first month are NaN
+    :return:            pandas.DataFrame indexed by date
     """
-    arr = data.loc[start:end].values
-    arr = np.ma.array(arr, mask=(arr == nd))
-
-    if statistic == 'mean':
-        return arr.mean()
-    elif statistic == 'sum':
-        return arr.sum()
-    else:
+    if statistic not in ('mean', 'sum'):
         raise NotImplementedError()
 
+    # get monthly sums and counts and their cumulative sums (starting at 0)
+    stats = data.masked.stats()
+    sums = stats['sum'].values
+    counts = stats['count'].values
+    cum_sums = np.concatenate([[0], np.cumsum(sums)])
+    cum_counts = np.concatenate([[0], np.cumsum(counts)])
+
+    df = pd.DataFrame(index=stats.index)
+    df[col] = sums if statistic == 'sum' else sums / counts
+
+    # the window of month i goes from month i - n to month i - 1
+    for name, n in (windows or {}).items():
+        window_sums = np.full(len(df), np.nan)
+        window_counts = np.full(len(df), np.nan)
+        window_sums[n:] = cum_sums[n:-1] - cum_sums[:-n - 1]
+        window_counts[n:] = cum_counts[n:-1] - cum_counts[:-n - 1]
+        if statistic == 'sum':
+            df[name] = window_sums
+        else:
+            df[name] = window_sums / window_counts
+
+    return df
+
 
 if __name__ == '__main__':
     # change directory
     os.chdir('../../data/tif')
 
-    # create empty DataFrame
+    # define columns of the final DataFrame
     columns = ['fire_pixels', 'evi', 'evi_prev', 'ppt', 'ppt_prev']
-    df = pd.DataFrame(columns=columns)
 
     # define date range
     date_range_off = pd.date_range('2001-10-01', '2016-12-31', freq='MS')
@@ -53,30 +77,23 @@ if __name__ == '__main__':
     # define products and their properties
     products = [
         {'path': 'MODIS/MOD14A2/prepared', 'col': 'fire_pixels', 'stat': 'sum',
-         'compute_prev': False, 'date_range': date_range},
+         'windows': {}, 'date_range': date_range},
         {'path': 'MODIS/MOD13A3/prepared', 'col': 'evi', 'stat': 'mean',
-         'compute_prev': True, 'date_range': date_range_off},
+         'windows': {'evi_prev': 3}, 'date_range': date_range_off},
         {'path': 'TRMM/3B43/prepared', 'col': 'ppt', 'stat': 'mean',
-         'compute_prev': True, 'date_range': date_range_off},
+         'windows': {'ppt_prev': 3}, 'date_range': date_range_off},
     ]
 
+    # compute the monthly and trailing statistics of every product
+    dfs = []
     for prod in products:
-        data = create_data_array(prod['path'], prod['date_range'])
-        nd = get_nodata_value(prod['path'])
-        for i, month in enumerate(date_range):
-            # calculate stat for current month
-            stat = get_data_statistic(data, nd, month, month, prod['stat'])
-            df.loc[i, prod['col']] = stat
-
-            # compute previous 3 month period
-            if prod['compute_prev']:
-                start = month - pd.DateOffset(months=3)
-                end = month - pd.DateOffset(months=1)
-                stat = get_data_statistic(data, nd, start, end, prod['stat'])
-                df.loc[i, f'{prod["col"]}_prev'] = stat
-
-    # set index as date and change data types
-    df.index = date_range
+        data = create_data_array(prod['path'], prod['date_range'],
+                                 chunks=data_chunks)
+        dfs.append(get_statistics(data, prod['col'], prod['stat'],
+                                  prod['windows']))
+    df = pd.concat(dfs, axis=1).loc[date_range, columns]
+
+    # change data types
     df['fire_pixels'] = df['fire_pixels'].astype('int')
     df[df.columns[1:]] = df[df.columns[1:]].astype('float')
 
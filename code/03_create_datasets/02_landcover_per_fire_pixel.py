@@ -9,8 +9,9 @@ import os
 
 import pandas as pd
 
-from code.functions import create_data_array, get_nodata_value
-from code.variables import landcovers
+from code.functions import create_data_array, get_fire_pixels, \
+                           read_fire_events
+from code.variables import data_chunks, landcovers
 
 if __name__ == '__main__':
     # change directory
@@ -20,38 +21,31 @@ if __name__ == '__main__':
     fire_folder = 'MOD14A2/prepared'
     lc_folder = 'MCD12Q1/prepared'
 
-    # define NoData values
-    fire_nd = get_nodata_value(fire_folder)
-    lc_nd = get_nodata_value(lc_folder)
-
-    # define date ranges to create the data arrays
-    months = pd.date_range('2002', '2017', freq='MS', closed='left')
+    # define date range to create the data array
     years = pd.date_range('2002', '2016', freq='AS').year.astype('str')
 
-    # create data arrays
-    fire_data = create_data_array(fire_folder, months)
-    lc_data = create_data_array(lc_folder, years)
+    # read fire pixels and create landcover data array, where Non-Flammable
+    # (0) is not valid
+    events = read_fire_events(fire_folder)
+    lc_data = create_data_array(lc_folder, years, chunks=data_chunks,
+                                invalid=(0,))
 
     # create empty DataFrame
     cols = ['year', 'code']
     df = pd.DataFrame(columns=cols)
 
     for year in years:
-        # filter data arrays by year
-        fire_arr = fire_data.loc[year].values
-        lc_arr = lc_data.loc[year].values
-
         # get all fire pixels for the whole year
-        mask = ((fire_arr != 0) & (fire_arr != fire_nd)).any(axis=0)
+        fire_rows, fire_cols, _ = get_fire_pixels(events, year)
 
         # get landcover values for fire pixels, excluding Non-Flammable and
         # NoData values
-        values = lc_arr[mask]
-        mask2 = (values != 0) & (values != lc_nd)
+        lc_arr, lc_mask = lc_data.masked.select(year)
+        values = lc_arr[fire_rows, fire_cols][lc_mask[fire_rows, fire_cols]]
 
         # create empty DataFrame to store the year's results
         year_df = pd.DataFrame(columns=cols)
-        year_df['code'] = values[mask2]
+        year_df['code'] = values
         year_df['year'] = year
 
         # append year's DataFrame to original DataFrame
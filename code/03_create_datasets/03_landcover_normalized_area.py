@@ -10,17 +10,16 @@ import os
 import numpy as np
 import pandas as pd
 
-from code.functions import create_data_array, get_nodata_value
-from code.variables import landcovers
+from code.functions import create_data_array
+from code.variables import data_chunks, landcovers
 
 if __name__ == '__main__':
     # change directory
     os.chdir('../../data/tif/MODIS/MCD12Q1/prepared')
 
-    # create landcover DataArray
+    # create landcover DataArray, where Non-Flammable (0) is not valid
     years = pd.date_range('2002', '2016', freq='AS').year.astype('str')
-    data = create_data_array('.', years)
-    nd = get_nodata_value('.')
+    data = create_data_array('.', years, chunks=data_chunks, invalid=(0,))
 
     # create empty DataFrame
     cols = ['year', 'code', 'pixels', 'proportion']
@@ -28,8 +27,7 @@ if __name__ == '__main__':
 
     for i, year in enumerate(years):
         # filter DataArray by year and get pixel count by landcover
-        arr = data.loc[year].values
-        mask = (arr != 0) & (arr != nd)
+        arr, mask = data.masked.select(year)
         values, counts = np.unique(arr[mask], return_counts=True)
 
         # create year's DataFrame
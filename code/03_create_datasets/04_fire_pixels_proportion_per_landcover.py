@@ -10,8 +10,9 @@ import os
 import numpy as np
 import pandas as pd
 
-from code.functions import create_data_array, get_nodata_value
-from code.variables import landcovers
+from code.functions import create_data_array, get_fire_pixels, \
+                           read_fire_events
+from code.variables import data_chunks, landcovers
 
 if __name__ == '__main__':
     # change directory
@@ -21,38 +22,32 @@ if __name__ == '__main__':
     fire_folder = 'MOD14A2/prepared'
     lc_folder = 'MCD12Q1/prepared'
 
-    # define NoData values
-    fire_nd = get_nodata_value(fire_folder)
-    lc_nd = get_nodata_value(lc_folder)
-
     # define date ranges to create the data arrays
     months = pd.date_range('2002', '2017', freq='MS', closed='left')
     years = pd.date_range('2002', '2016', freq='AS').year.astype('str')
 
-    # create data arrays
-    fire_data = create_data_array(fire_folder, months)
-    lc_data = create_data_array(lc_folder, years)
+    # read fire pixels and create landcover data array, where Non-Flammable
+    # (0) is not valid
+    events = read_fire_events(fire_folder)
+    lc_data = create_data_array(lc_folder, years, chunks=data_chunks,
+                                invalid=(0,))
 
     # create empty DataFrame
     df = pd.DataFrame(columns=list(landcovers.values()))
 
     for i, month in enumerate(months):
-        # filter DataArrays by month
-        fire_arr = fire_data.loc[month].values
-        lc_arr = lc_data.loc[str(month.year)].values
-
-        # define masks
-        fire_mask = (fire_arr != 0) & (fire_arr != fire_nd)
+        # get month's fire pixels and year's landcover
+        rows, cols, counts = get_fire_pixels(events, month)
+        lc_arr, lc_mask = lc_data.masked.select(str(month.year))
 
         # compute number of fire pixels for each type of landcover
+        fire_lc = lc_arr[rows, cols]
         fire_pixels_per_cover = []
         for val in landcovers.keys():
-            mask = (lc_arr == val)
-            fire_pixels = fire_arr[fire_mask & mask].sum()
+            fire_pixels = counts[fire_lc == val].sum()
             fire_pixels_per_cover.append(fire_pixels)
 
         # compute total number of pixels for each type of landcover
-        lc_mask = (lc_arr != 0) & (lc_arr != lc_nd)
         pixels_per_cover = np.unique(lc_arr[lc_mask], return_counts=True)[1]
 
         # compute proportions and store them in DataFrame
@@ -3,6 +3,8 @@
 # Date:     November, 2019
 # Author:   Marcelo Villa P.
 # Purpose:  Creates yearly forest proximity rasters.
+# Notes:    The rasters are also consolidated into a datacube (see
+#           code.functions.build_datacube).
 # =============================================================================
 import glob
 import os
@@ -10,36 +12,35 @@ import re
 
 import gdal
 
+from code.functions import build_datacube, create_tif, get_raster_info
 from code.variables import landcovers
 
 
-def create_proximity_raster(src, dst, values, units='PIXEL'):
+def create_proximity_raster(src, dst, values, units='PIXEL', nd_val=32767):
     """
     Creates a proximity raster using gdal.ComputeProximity. NoData pixels in
     the src raster will be considered NoData pixels in the dst raster.
-    :param src: source raster filename
-    :param dst: dest raster filename
-    :return:    None
+    :param src:     source raster filename
+    :param dst:     dest raster filename
+    :param values:  list of pixel values to compute the distance to
+    :param units:   distance units ('PIXEL' or 'GEO')
+    :param nd_val:  dst raster's NoData value
+    :return:        None
     """
-    # open src raster
-    ds = gdal.Open(src, 0)
-    gt = ds.GetGeoTransform()
-    sr = ds.GetProjection()
-    cols = ds.RasterXSize
-    rows = ds.RasterYSize
-
-    # create dst raster
-    driver = gdal.GetDriverByName('GTiff')
-    out_ds = driver.Create(dst, cols, rows, 1, gdal.GDT_Int16)
-    out_ds.SetGeoTransform(gt)
-    out_ds.SetProjection(sr)
+    # create dst raster with the src raster's georeferencing
+    info = get_raster_info(src)
+    rows, cols = info['shape']
+    out_ds = create_tif(dst, cols, rows, info['projection'],
+                        info['geotransform'], gdal.GDT_Int16, nd_val)
 
     # define options for gdal.ComputeProximity and execute it
     options = [
         f'VALUES={",".join(map(str, values))}',
         f'DISTUNITS={units}',
-        'USE_INPUT_NODATA=YES'
+        'USE_INPUT_NODATA=YES',
+        f'NODATA={nd_val}'
     ]
+    ds = gdal.Open(src, 0)
     gdal.ComputeProximity(ds.GetRasterBand(1), out_ds.GetRasterBand(1), options)
 
     del ds, out_ds
@@ -69,3 +70,6 @@ if __name__ == '__main__':
         dst_fn = os.path.join(save_to, base_name)
         if not os.path.exists(dst_fn):
             create_proximity_raster(fn, dst_fn, [forest_val])
+
+    # consolidate the yearly rasters into a datacube
+    build_datacube(save_to)
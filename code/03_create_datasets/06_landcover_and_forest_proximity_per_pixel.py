@@ -11,8 +11,9 @@ import numpy as np
 import pandas as pd
 from imblearn.under_sampling import RandomUnderSampler
 
-from code.functions import create_data_array, get_nodata_value
-from code.variables import landcovers
+from code.functions import create_data_array, get_fire_pixels, \
+                           get_fire_validity, read_fire_events
+from code.variables import data_chunks, landcovers
 
 if __name__ == '__main__':
     # change directory
@@ -26,35 +27,31 @@ if __name__ == '__main__':
     # define year and date ranges
     year = '2009'
     years = pd.date_range('2002', '2016', freq='AS').year.astype('str')
-    months = pd.date_range('2002', '2017', freq='MS', closed='left')
 
-    # create DataArrays
-    fire_data = create_data_array(fire_path, months)
-    lc_data = create_data_array(lc_path, years)
-    dtnf_data = create_data_array(dtnf_path, years)
+    # read fire pixels and create DataArrays, where Non-Flammable land cover
+    # (0) is not valid
+    events = read_fire_events(fire_path)
+    lc_data = create_data_array(lc_path, years, chunks=data_chunks,
+                                invalid=(0,))
+    dtnf_data = create_data_array(dtnf_path, years, chunks=data_chunks)
 
     # create empty DataFrame
     cols = ['year', 'is_fire_pixel', 'lc_code', 'forest_distance']
     df = pd.DataFrame(columns=cols)
 
     for year in years:
-        # extract fire values for the given year
-        fire_arr = fire_data.loc[year].values
-        fire_nd = get_nodata_value(fire_path)
-        fire_mask = (fire_arr == fire_nd)
-        fire_arr = np.ma.array(fire_arr, mask=fire_mask).sum(axis=0)
-        fire_arr = np.ma.where(fire_arr > 0, 1, fire_arr).filled(fire_nd)
+        # flag pixels with at least one fire during the given year. Pixels
+        # without valid values during the whole year are not valid
+        fire_mask = get_fire_validity(events, year)
+        fire_rows, fire_cols, _ = get_fire_pixels(events, year)
+        fire_arr = np.zeros(fire_mask.shape, int)
+        fire_arr[fire_rows, fire_cols] = 1
 
         # extract land cover and dtnf values for the given year
-        lc_arr = lc_data.loc[year].values
-        dtnf_arr = dtnf_data.loc[year].values
-
-        # create masks
-        fire_mask = (fire_arr != fire_nd)
-        lc_nd = get_nodata_value(lc_path)
-        lc_mask = (lc_arr != lc_nd) & (lc_arr != 0)
-        dtnf_nd = 32767
-        dtnf_mask = (dtnf_arr != dtnf_nd)
+        lc_arr, lc_mask = lc_data.masked.select(year)
+        dtnf_arr, dtnf_mask = dtnf_data.masked.select(year)
+
+        # combine masks
         mask = fire_mask & lc_mask & dtnf_mask
 
         # create empty year DataFrame
@@ -12,8 +12,8 @@ import matplotlib.pyplot as plt
 import pandas as pd
 import seaborn as sns
 
-from code.functions import beautify_ax, create_data_array, get_nodata_value, \
-                           init_sns
+from code.functions import beautify_ax, create_data_array, get_fire_events, \
+                           init_sns, read_fire_events
 from code.variables import edge_color, evi_scaling_factor, face_color, \
                            hue_one, hue_two
 
@@ -23,11 +23,12 @@ if __name__ == '__main__':
     fire_path = 'MODIS/MOD14A2/prepared'
     paths = ['TRMM/3B43/prepared', 'MODIS/MOD13A3/prepared']
 
-    # create fire array and get NoData value
+    # get the position (time, row and column) of every fire pixel
     date_range = pd.date_range('2002', '2017', freq='MS', closed='left')
-    fire_arr = create_data_array(fire_path, date_range).values
-    fire_nd = get_nodata_value(fire_path)
-    fire_mask = (fire_arr != fire_nd) & (fire_arr != 0)
+    events = read_fire_events(fire_path)
+    dates, rows, cols, _ = get_fire_events(events, date_range[0],
+                                           date_range[-1])
+    t = date_range.get_indexer(dates)
 
     # initialize seaborn environment and create figure and axes
     init_sns()
@@ -36,13 +37,11 @@ if __name__ == '__main__':
     labels = ['Precipitation (mm/month)', 'Enhanced Vegetation Index']
 
     for i, path in enumerate(paths):
-        arr = create_data_array(path, date_range, offset=3).values
-        nd = get_nodata_value(path)
-        mask = (arr != nd)
+        arr, mask = create_data_array(path, date_range).masked.select()
 
         # get all values (excluding NoData) and masked values (for fire-pixels)
         all_values = arr[mask]
-        masked_values = arr[mask & fire_mask]
+        masked_values = arr[t, rows, cols][mask[t, rows, cols]]
 
         for j, values in enumerate([all_values, masked_values]):
             # rescale values for EVI
@@ -12,8 +12,8 @@ import numpy as np
 import pandas as pd
 import seaborn as sns
 
-from code.functions import beautify_ax, create_data_array, get_nodata_value, \
-                           init_sns
+from code.functions import beautify_ax, create_data_array, get_fire_pixels, \
+                           init_sns, read_fire_events
 from code.variables import edge_color, face_color, hue_one
 
 
@@ -23,23 +23,23 @@ if __name__ == '__main__':
     fire_path = 'MOD14A2/prepared'
     dtnf_path = 'derived/DTNF'
 
-    # create fire array and get NoData value
+    # get the position (year, row and column) of the fire pixels of each year
     date_range = pd.date_range('2002', '2017', freq='MS', closed='left')
-    fire_data = create_data_array(fire_path, date_range)
-    fire_nd = get_nodata_value(fire_path)
-    fire_mask = (fire_data != fire_nd) & (fire_data != 0)
-
-    # create fire pixels mask grouped by year
-    grouped_fire_mask = fire_mask.groupby(fire_data.t.dt.year).any(dim='t').values
-
-    # create DataArray for forest proximity and fire
     years = date_range.year.unique().astype('str')
-    arr = create_data_array(dtnf_path, years).values
-    nd = 32767
-    mask = (arr != nd)
+    events = read_fire_events(fire_path)
+    t, rows, cols = [], [], []
+    for i, year in enumerate(years):
+        year_rows, year_cols, _ = get_fire_pixels(events, year)
+        t.append(np.full(len(year_rows), i))
+        rows.append(year_rows)
+        cols.append(year_cols)
+    t, rows, cols = map(np.concatenate, (t, rows, cols))
+
+    # create DataArray for forest proximity and its mask
+    arr, mask = create_data_array(dtnf_path, years).masked.select()
 
     # get distance values for fire pixels and create bins for the histogram
-    values = arr[grouped_fire_mask & mask]
+    values = arr[t, rows, cols][mask[t, rows, cols]]
     bins = np.arange(values.min(), values.max()) - 0.5  # one pixel bins
 
     # initialize seaborn environment and create plot
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# =============================================================================
+# Date:     October, 2026
+# Author:   Marcelo Villa P.
+# Purpose:  Contains a small client for the AppEEARS API that is shared by the
+#           scripts that create and download tasks.
+# Notes:    The client keeps a single connection pool for all of its calls and
+#           caches the bearer token until it expires, so several tasks (e.g.
+#           for different AOIs and products) can be created, polled and
+#           downloaded with a single login. For more information about the
+#           AppEEARS API go to:
+#           https://lpdaacsvc.cr.usgs.gov/appeears/api/
+# =============================================================================
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+API = 'https://lpdaacsvc.cr.usgs.gov/appeears/api'
+
+
+class AppEEARSClient:
+    """
+    AppEEARS API client with a cached bearer token and a pooled session.
+    :param user:    Earthdata username
+    :param pwd:     Earthdata password
+    :param api:     api url
+    :param workers: number of keep-alive connections to keep in the pool
+    :param margin:  number of seconds before the token expiration at which a
+                    new token is requested
+    """
+    def __init__(self, user, pwd, api=API, workers=1, margin=60):
+        self.user = user
+        self.pwd = pwd
+        self.api = api
+        self.workers = workers
+        self.margin = datetime.timedelta(seconds=margin)
+
+        # create a session whose pool can hold a connection for each worker
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._token = None
+        self._expiration = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """
+        Closes the client's session and its pooled connections.
+        :return: None
+        """
+        self.session.close()
+
+    def login(self):
+        """
+        Requests a new token and stores it along its expiration date.
+        :return: token
+        """
+        r = self.session.post(f'{self.api}/login', auth=(self.user, self.pwd))
+        r.raise_for_status()
+        info = r.json()
+        self._token = info['token']
+
+        # tokens without an expiration date are used only once
+        if 'expiration' in info:
+            exp = datetime.datetime.strptime(info['expiration'],
+                                             '%Y-%m-%dT%H:%M:%SZ')
+            self._expiration = exp
+        else:
+            self._expiration = datetime.datetime.utcnow()
+
+        return self._token
+
+    @property
+    def token(self):
+        """
+        Bearer token, requested again only when it is about to expire.
+        """
+        with self._lock:
+            now = datetime.datetime.utcnow()
+            if self._token is None or now >= self._expiration - self.margin:
+                self.login()
+            return self._token
+
+    @property
+    def header(self):
+        """
+        Authorization header built with the cached token.
+        """
+        return {'Authorization': f'Bearer {self.token}'}
+
+    def get(self, path, **kwargs):
+        """
+        Makes an authorized GET call to the API.
+        :param path:    path relative to the api url
+        :param kwargs:  keyword arguments passed to requests.Session.get
+        :return:        requests.Response object
+        """
+        r = self.session.get(f'{self.api}/{path}', headers=self.header,
+                             **kwargs)
+        r.raise_for_status()
+
+        return r
+
+    def create_task(self, task):
+        """
+        Creates a task using the AppEEARS API.
+        :param task:    task definition (see the API's task service)
+        :return:        task id
+        """
+        r = self.session.post(f'{self.api}/task', json=task,
+                              headers=self.header)
+
+        # check if call was successful
+        if r.status_code == 202:
+            return r.json()['task_id']
+        else:
+            raise Exception(f'Error creating task: {r.json()["message"]}')
+
+    def create_tasks(self, tasks):
+        """
+        Submits several tasks in a batch, sharing the token and the
+        connection pool.
+        :param tasks:   list of task definitions
+        :return:        list of task ids in the same order as tasks
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            return list(executor.map(self.create_task, tasks))
+
+    def status(self, task_id):
+        """
+        Gets the status information of a task.
+        :param task_id: task id
+        :return:        dictionary with the status information
+        """
+        return self.get(f'status/{task_id}').json()
+
+    def bundle(self, task_id):
+        """
+        Gets the information of the files available for a task.
+        :param task_id: task id
+        :return:        dictionary with the bundle information
+        """
+        return self.get(f'bundle/{task_id}').json()
+
+    def download(self, task_id, fid):
+        """
+        Opens a streamed call to download a single file from a task bundle.
+        :param task_id: task id
+        :param fid:     file id
+        :return:        requests.Response object
+        """
+        return self.get(f'bundle/{task_id}/{fid}', stream=True)
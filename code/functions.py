@@ -6,33 +6,63 @@
 # =============================================================================
 import datetime
 import glob
+import hashlib
+import json
 import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, \
+                               as_completed
 
 import gdal
 import numpy as np
+import ogr
+import pandas as pd
 import seaborn as sns
 import xarray as xr
 
+import code.masked  # registers the DataArray.masked accessor
+from code.variables import data_chunks, gdal_cache_mb, process_workers, \
+                           read_workers, tif_block_size, tif_compress, \
+                           tif_overviews, warp_memory_mb, warp_threads
 
-def array_to_tif(arr, fn, sr, geotransform, gdtype, nd_val=None):
+# lock used to serialize manifest updates made by several download workers
+manifest_lock = threading.Lock()
+
+# raster metadata (or first GeoTIFF of a folder) cached by path, along with
+# the modification time it was read at
+raster_info_cache = {}
+
+
+def array_to_tif(arr, fn, sr, geotransform, gdtype, nd_val=None,
+                 options=None, overviews=tif_overviews):
     """
-    Writes a 2D NumPy array to a GeoTIFF file in disk.
+    Writes a 2D NumPy array to a GeoTIFF file in disk. By default, the file is
+    tiled and compressed (see get_creation_options). If overviews are
+    requested, they are built in memory first and copied along with the data
+    so the file has a Cloud-Optimized GeoTIFF (COG) layout.
     :param arr:             2D NumPy array
     :param fn:              output GeoTIFF's file name
     :param sr:              output GeoTIFF's spatial reference
     :param geotransform:    output GeoTIFF's geotransform
     :param gdtype:          GDAL data type
     :param nd_val:          output GeoTIFF's NoData value
+    :param options:         list of GeoTIFF creation options. If None, the
+                            ones returned by get_creation_options are used
+    :param overviews:       whether to build overviews
     :return:                None
     """
-
-    # get driver and create output TIFF
-    driver = gdal.GetDriverByName('GTiff')
-    out_tif = driver.Create(fn, arr.shape[1], arr.shape[0], 1, gdtype)
-
-    # set projection and geotransform
-    out_tif.SetProjection(sr)
-    out_tif.SetGeoTransform(geotransform)
+    # create output TIFF (in memory if overviews are needed)
+    if overviews:
+        driver = gdal.GetDriverByName('MEM')
+        out_tif = driver.Create('', arr.shape[1], arr.shape[0], 1, gdtype)
+        out_tif.SetProjection(sr)
+        out_tif.SetGeoTransform(geotransform)
+    else:
+        out_tif = create_tif(fn, arr.shape[1], arr.shape[0], sr, geotransform,
+                             gdtype, options=options)
 
     # set NoData value and write array
     band = out_tif.GetRasterBand(1)
@@ -40,6 +70,17 @@ def array_to_tif(arr, fn, sr, geotransform, gdtype, nd_val=None):
         band.SetNoDataValue(nd_val)
     band.WriteArray(arr)
 
+    # build overviews and copy them to disk before the data
+    if overviews:
+        if options is None:
+            options = get_creation_options(gdtype)
+        resampling = 'AVERAGE' if is_float(gdtype) else 'NEAREST'
+        out_tif.BuildOverviews(resampling, get_overview_levels(arr.shape))
+        gtiff = gdal.GetDriverByName('GTiff')
+        cog = gtiff.CreateCopy(fn, out_tif,
+                               options=options + ['COPY_SRC_OVERVIEWS=YES'])
+        del cog
+
     # flush to disk
     band.FlushCache()
     del out_tif, band
@@ -85,57 +126,596 @@ def beautify_box(ax, edge_color, face_color):
             ax.lines[n].set_color(edge_color)
 
 
-def create_data_array(folder, date_range, offset=None):
+def build_datacube(folder, chunks=data_chunks):
+    """
+    Consolidates all the GeoTIFF files found in a folder into a single
+    chunked and compressed Zarr store (see get_datacube_path). The store has
+    the dates parsed from the files' names as time coordinates and keeps the
+    NoData value, geotransform, projection and a fingerprint of the source
+    files as attributes. Stores that are already up to date are kept.
+    :param folder:  path to the folder with the GeoTIFF files
+    :param chunks:  tuple with the chunk sizes in the t, y and x dimensions
+    :return:        path to the store
+    """
+    catalog = get_catalog(folder)
+    filenames = [entry['path'] for entry in catalog]
+    path = get_datacube_path(folder)
+    if open_datacube(folder, filenames) is not None:
+        return path
+
+    # get spatial metadata from the first file
+    info = get_raster_info(filenames[0])
+    attrs = {'geotransform': list(info['geotransform']),
+             'projection': info['projection'],
+             'sources': fingerprint_files(filenames)}
+    if info['nodata'] is not None:
+        attrs['nodata'] = info['nodata']
+
+    # write to a temporary store and replace the old one when done
+    dates = [entry['date'] for entry in catalog]
+    data = xr.DataArray(create_dask_array(filenames, chunks),
+                        coords={'t': dates}, dims=('t', 'y', 'x'),
+                        name='data', attrs=attrs)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    data.to_dataset().to_zarr(tmp, mode='w', consolidated=True)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp, path)
+
+    return path
+
+
+def build_fire_events(folder):
+    """
+    Builds a sparse store of the fire pixels of the monthly fire GeoTIFF
+    files of a folder (see get_fire_events_path). For every pixel with at
+    least one fire (i.e. not NoData and greater than 0) the store has its
+    time position, row, column and number of fires. It also keeps the dates
+    of the files, the shape of the grid, a bit-packed mask of the pixels
+    with at least one valid (not NoData) value for each year and a
+    fingerprint of the source files. Stores that are already up to date are
+    kept.
+    :param folder:  path to the folder with the monthly fire GeoTIFF files
+    :return:        path to the store
+    """
+    catalog = get_catalog(folder)
+    filenames = [entry['path'] for entry in catalog]
+    sources = fingerprint_files(filenames)
+    path = get_fire_events_path(folder)
+    if os.path.exists(path):
+        with np.load(path) as events:
+            if str(events['sources']) == sources:
+                return path
+
+    nd = catalog[0]['nodata']
+    dates = np.array([entry['date'] for entry in catalog], 'datetime64[D]')
+    years = np.unique(dates.astype('datetime64[Y]').astype(int) + 1970)
+    shape = catalog[0]['shape']
+    valid = np.zeros((len(years), shape[0], shape[1]), bool)
+
+    # read one month at a time and keep only its fire pixels
+    t, rows, cols, counts = [], [], [], []
+    for i, entry in enumerate(catalog):
+        arr = read_rasters([entry['path']])[0]
+        mask = (arr != nd)
+        valid[np.searchsorted(years, entry['date'].year)] |= mask
+        r, c = np.nonzero(mask & (arr > 0))
+        t.append(np.full(len(r), i, np.int32))
+        rows.append(r.astype(np.int32))
+        cols.append(c.astype(np.int32))
+        counts.append(arr[r, c])
+
+    # write to a temporary file and replace the old store when done
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez_compressed(f, t=np.concatenate(t), row=np.concatenate(rows),
+                            col=np.concatenate(cols),
+                            count=np.concatenate(counts), dates=dates,
+                            shape=np.array(shape), years=years,
+                            valid=np.packbits(valid, axis=-1),
+                            sources=np.array(sources))
+    os.replace(tmp, path)
+
+    return path
+
+
+def configure_gdal(cache_mb=gdal_cache_mb, threads=warp_threads):
+    """
+    Sets GDAL's block cache size and the number of threads used by GDAL's
+    multithreaded operations (e.g. warping) for the current process.
+    :param cache_mb:    cache size in megabytes
+    :param threads:     number of threads (or 'ALL_CPUS')
+    :return:            None
+    """
+    gdal.SetCacheMax(cache_mb * 1024 * 1024)
+    gdal.SetConfigOption('GDAL_NUM_THREADS', str(threads))
+
+
+def create_data_array(folder, date_range, chunks=None, workers=read_workers,
+                      invalid=()):
     """
-    Creates a xarray DataArray from all the GeoTIFF files found in the folder
-    parameter. The result DataArray has three dimensions:
+    Creates a xarray DataArray from the GeoTIFF files found in the folder
+    parameter for each date of date_range. Files are selected by the date in
+    their names (see get_catalog), so only the files of the requested dates
+    are read. The result DataArray has three dimensions:
         * t: time
         * y: latitude
         * x: longitude
 
+    If chunks is given, the DataArray is lazy: it is backed by a dask array
+    and only the chunks touched by a selection (e.g. .loc[year]) are read
+    from disk when its values are requested.
+
+    If the folder has an up to date datacube (see build_datacube), the data
+    is read from it (using the datacube's chunks) instead of the GeoTIFFs.
+
+    The DataArray keeps the files' NoData value and the invalid values as
+    attributes, which are used by its masked accessor (see code.masked).
+
     :param folder:      path to the folder with the GeoTIFF files
     :param date_range:  pandas.core.indexes.datetimes.DatetimeIndex object,
-                        which can be created using the pd.date_range function
-    :param offset:      number of files to skip at the beginning
+                        which can be created using the pd.date_range function,
+                        or index of strings (e.g. years) that can be parsed
+                        as dates
+    :param chunks:      tuple with the chunk sizes in the t, y and x
+                        dimensions. If None, every file is read right away
+    :param workers:     number of files to read in parallel when chunks is
+                        None
+    :param invalid:     values that are not valid besides the NoData value
+                        (e.g. 0 for Non-Flammable land cover)
     :return:            xarray.core.dataarray.DataArray object
     """
-    # read each individual array, store them and stack them
-    data = []
-    for fn in glob.glob(os.path.join(folder, '*.tif'))[offset:]:
-        ds = gdal.Open(fn, 0)
-        arr = ds.ReadAsArray()
-        data.append(arr)
-        del ds, arr
-    data = np.stack(data)
+    # select the file of every date from the folder's catalog
+    catalog = get_catalog(folder)
+    by_date = {entry['date']: entry['path'] for entry in catalog}
+    dates = pd.to_datetime(date_range).to_pydatetime()
+    missing = [date for date in dates if date not in by_date]
+    if missing:
+        raise Exception(f'No files found in {folder} for {len(missing)} '
+                        f'dates (first: {missing[0]:%Y-%m-%d}).')
+    filenames = [by_date[date] for date in dates]
+
+    # read from the folder's datacube if it is up to date
+    cube = open_datacube(folder, [entry['path'] for entry in catalog])
+    if cube is not None:
+        data = cube.sel(t=dates).data
+        if chunks is None:
+            data = data.compute()
+    elif chunks is not None:
+        data = create_dask_array(filenames, chunks)
+    else:
+        data = create_cube(filenames, workers)
+
+    attrs = {'nodata': catalog[0]['nodata'], 'invalid': list(invalid)}
+    return xr.DataArray(data, coords={'t': date_range}, dims=('t', 'y', 'x'),
+                        attrs=attrs)
+
+
+def create_cube(filenames, workers=1):
+    """
+    Reads a list of GeoTIFF files with the same size into a single 3D array.
+    The array is allocated once and each file is read directly into its time
+    slice, using a pool of threads (GDAL releases the GIL while reading).
+    :param filenames:   list of GeoTIFF filenames
+    :param workers:     number of files to read in parallel
+    :return:            3D numpy array
+    """
+    # get size and data type from the first file
+    info = get_raster_info(filenames[0])
+    y_size, x_size = info['shape']
+    dtype = info['dtype']
+
+    cube = np.empty((len(filenames), y_size, x_size), dtype)
+
+    def read(i):
+        ds = gdal.Open(filenames[i], 0)
+        if ds.ReadAsArray(buf_obj=cube[i]) is None:
+            raise Exception(f'{filenames[i]} could not be read.')
+        del ds
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(read, range(len(filenames))))
+
+    return cube
+
+
+def create_dask_array(filenames, chunks):
+    """
+    Creates a lazy 3D dask array from a list of GeoTIFF files with the same
+    size. Each chunk reads a window of a group of consecutive files only when
+    it is computed.
+    :param filenames:   list of GeoTIFF filenames
+    :param chunks:      tuple with the chunk sizes in the t, y and x
+                        dimensions
+    :return:            dask.array.Array object
+    """
+    # dask is only needed for lazy arrays
+    import dask
+    import dask.array as da
+
+    # get size and data type from the first file
+    info = get_raster_info(filenames[0])
+    y_size, x_size = info['shape']
+    dtype = info['dtype']
+
+    t_chunk, y_chunk, x_chunk = chunks
+    blocks = []
+    for t in range(0, len(filenames), t_chunk):
+        fns = filenames[t:t + t_chunk]
+        rows = []
+        for yoff in range(0, y_size, y_chunk):
+            ysize = min(y_chunk, y_size - yoff)
+            row = []
+            for xoff in range(0, x_size, x_chunk):
+                xsize = min(x_chunk, x_size - xoff)
+                block = dask.delayed(read_rasters)(fns,
+                                                   (xoff, yoff, xsize, ysize))
+                shape = (len(fns), ysize, xsize)
+                row.append(da.from_delayed(block, shape, dtype))
+            rows.append(row)
+        blocks.append(rows)
+
+    return da.block(blocks)
+
+
+def create_tif(fn, xsize, ysize, sr, geotransform, gdtype, nd_val=None,
+               options=None):
+    """
+    Creates an empty single band GeoTIFF file in disk that can be written
+    window by window (e.g. with process_blocks).
+    :param fn:              output GeoTIFF's file name
+    :param xsize:           number of columns
+    :param ysize:           number of rows
+    :param sr:              output GeoTIFF's spatial reference
+    :param geotransform:    output GeoTIFF's geotransform
+    :param gdtype:          GDAL data type
+    :param nd_val:          output GeoTIFF's NoData value
+    :param options:         list of GeoTIFF creation options. If None, the
+                            ones returned by get_creation_options are used
+    :return:                gdal.Dataset object
+    """
+    if options is None:
+        options = get_creation_options(gdtype)
+
+    driver = gdal.GetDriverByName('GTiff')
+    out_tif = driver.Create(fn, xsize, ysize, 1, gdtype, options=options)
+    out_tif.SetProjection(sr)
+    out_tif.SetGeoTransform(geotransform)
+    if nd_val:
+        out_tif.GetRasterBand(1).SetNoDataValue(nd_val)
+
+    return out_tif
+
+
+def file_checksum(path, algorithm='sha256'):
+    """
+    Computes the checksum of a file reading it in chunks.
+    :param path:        path to the file
+    :param algorithm:   name of a hashlib algorithm
+    :return:            hex digest of the file
+    """
+    h = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+
+def fingerprint_files(filenames):
+    """
+    Fingerprints a list of files by their names, sizes and modification
+    times.
+    :param filenames:   list of filenames
+    :return:            hex digest
+    """
+    h = hashlib.sha256()
+    for fn in filenames:
+        stat = os.stat(fn)
+        h.update(f'{os.path.basename(fn)}{stat.st_size}'
+                 f'{stat.st_mtime_ns}'.encode())
+
+    return h.hexdigest()
+
+
+def get_aoi_mask(shp, info, cache_dir):
+    """
+    Gets the path to the rasterized version of an Area Of Interest (AOI)
+    shapefile on a raster grid, which only covers the window of the grid
+    that covers the AOI's extent. The AOI is rasterized only once per grid
+    and cached as a GeoTIFF whose name depends on the shapefile's files and
+    the grid, so the cache is invalidated whenever one of them changes. The
+    shapefile must have the same spatial reference as the grid. Masks should
+    be created by a single process (e.g. before dispatching the jobs that
+    read them with read_aoi_mask).
+    :param shp:         path to the AOI shapefile
+    :param info:        dictionary with the geotransform, projection and
+                        shape keys of the grid (see get_raster_info)
+    :param cache_dir:   folder to store the rasterized masks in
+    :return:            path to the rasterized mask
+    """
+    gt = info['geotransform']
+    sr = info['projection']
+    rows, cols = info['shape']
+
+    # build a key from the shapefile's files and the grid properties
+    h = hashlib.sha256()
+    for fn in sorted(glob.glob(f'{os.path.splitext(shp)[0]}.*')):
+        stat = os.stat(fn)
+        h.update(f'{os.path.abspath(fn)}{stat.st_size}{stat.st_mtime}'.encode())
+    h.update(f'{gt}{sr}{cols}{rows}'.encode())
+    path = os.path.join(cache_dir, f'aoi_{h.hexdigest()[:16]}.tif')
+
+    if not os.path.exists(path):
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # compute the window of the grid that covers the AOI's extent
+        shp_ds = ogr.Open(shp)
+        layer = shp_ds.GetLayer()
+        min_x, max_x, min_y, max_y = layer.GetExtent()
+        xoff = max(int(np.floor((min_x - gt[0]) / gt[1])), 0)
+        yoff = max(int(np.floor((max_y - gt[3]) / gt[5])), 0)
+        xend = min(int(np.ceil((max_x - gt[0]) / gt[1])), cols)
+        yend = min(int(np.ceil((min_y - gt[3]) / gt[5])), rows)
+
+        # rasterize the AOI on the window
+        driver = gdal.GetDriverByName('GTiff')
+        tmp = f'{path}.{os.getpid()}.tmp'
+        out_ds = driver.Create(tmp, xend - xoff, yend - yoff, 1, gdal.GDT_Byte)
+        out_ds.SetProjection(sr)
+        out_ds.SetGeoTransform((gt[0] + xoff * gt[1], gt[1], 0,
+                                gt[3] + yoff * gt[5], 0, gt[5]))
+        gdal.RasterizeLayer(out_ds, [1], layer, burn_values=[1])
+        del out_ds, layer, shp_ds
+        os.replace(tmp, path)
+
+    return path
+
+
+def get_catalog(folder):
+    """
+    Gets the catalog of the GeoTIFF files of a folder. The catalog is stored
+    in a JSON file next to the folder (e.g. prepared.catalog.json) and has
+    the date (parsed from the name), shape, data type, geotransform and
+    NoData value of every file. Only new or modified files are opened to
+    update it.
+    :param folder:  path to the folder with the GeoTIFF files
+    :return:        list of entries (dictionaries with the path, date,
+                    shape, dtype, geotransform and nodata keys) sorted by
+                    date
+    """
+    path = f'{os.path.abspath(folder)}.catalog.json'
+    catalog = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            catalog = json.load(f)
+
+    entries = {}
+    for fn in glob.glob(os.path.join(folder, '*.tif')):
+        name = os.path.basename(fn)
+        stat = os.stat(fn)
+        entry = catalog.get(name, {})
+        if (entry.get('size') != stat.st_size or
+                entry.get('mtime') != stat.st_mtime_ns):
+            info = get_raster_info(fn)
+            entry = {'date': f'{get_file_date(fn):%Y-%m-%d}',
+                     'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+                     'shape': list(info['shape']),
+                     'dtype': str(info['dtype']),
+                     'geotransform': list(info['geotransform']),
+                     'nodata': info['nodata']}
+        entries[name] = entry
+
+    # write the catalog only if it changed
+    if entries != catalog:
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(entries, f, indent=2, sort_keys=True)
+        os.replace(tmp, path)
+
+    catalog = []
+    for name, entry in sorted(entries.items(),
+                              key=lambda item: (item[1]['date'], item[0])):
+        date = datetime.datetime.strptime(entry['date'], '%Y-%m-%d')
+        catalog.append(dict(entry, path=os.path.join(folder, name),
+                            date=date))
+
+    return catalog
+
+
+def get_creation_options(gdtype, compress=tif_compress,
+                         block_size=tif_block_size):
+    """
+    Gets GeoTIFF creation options for a tiled and compressed file. The
+    predictor is chosen according to the data type (floating point predictor
+    for float data and horizontal differencing for integer data).
+    :param gdtype:      GDAL data type
+    :param compress:    compression algorithm (e.g. 'DEFLATE' or 'ZSTD'). If
+                        None, the file is not compressed
+    :param block_size:  width and height of the tiles
+    :return:            list of creation options
+    """
+    options = ['TILED=YES', f'BLOCKXSIZE={block_size}',
+               f'BLOCKYSIZE={block_size}']
+    if compress:
+        predictor = 3 if is_float(gdtype) else 2
+        options += [f'COMPRESS={compress}', f'PREDICTOR={predictor}']
+
+    return options
+
+
+def get_datacube_path(folder):
+    """
+    Gets the path of the Zarr store of a folder with GeoTIFF files, which is
+    a sibling of the folder (e.g. MOD14A2/prepared.zarr).
+    :param folder:  path to the folder with the GeoTIFF files
+    :return:        path to the store
+    """
+    return f'{os.path.abspath(folder)}.zarr'
+
+
+def get_file_date(fn):
+    """
+    Gets the date of a file from its name. Names can have a date as a year
+    and day of year (e.g. doy2001274), as a year and month (e.g.
+    MOD14A2_200201.tif) or as a year (e.g. MCD12Q1_2002.tif).
+    :param fn:  filename
+    :return:    datetime.datetime object
+    """
+    name = os.path.basename(fn)
+    match = re.search('doy([0-9]{7})', name)
+    if match:
+        return datetime.datetime.strptime(match.group(1), '%Y%j')
+
+    match = re.search('_([0-9]{6}|[0-9]{4})\\.', name)
+    if match:
+        date = match.group(1)
+        return datetime.datetime.strptime(date, '%Y%m' if len(date) == 6
+                                          else '%Y')
+
+    raise Exception(f'No date found in {fn}.')
+
 
-    return xr.DataArray(data, coords={'t': date_range}, dims=('t', 'y', 'x'))
+def get_fire_events(events, start=None, end=None):
+    """
+    Gets the fire pixels of a fire events store between two dates.
+    :param events:  dictionary returned by read_fire_events
+    :param start:   first date (e.g. '2009', '2009-01' or a pd.Timestamp).
+                    If None, the events are selected from the beginning
+    :param end:     last date (included). If None, the end of the start
+                    period (e.g. the whole year for '2009') is used
+    :return:        tuple with the dates, rows, columns and number of fires
+                    of every fire pixel, sorted by date, row and column
+    """
+    if start is not None and end is None:
+        end = start
+    loc = pd.DatetimeIndex(events['dates']).slice_indexer(start, end)
+    sel = (events['t'] >= loc.start) & (events['t'] < loc.stop)
+
+    return (events['dates'][events['t'][sel]], events['row'][sel],
+            events['col'][sel], events['count'][sel])
+
+
+def get_fire_events_path(folder):
+    """
+    Gets the path of the fire events store of a folder with monthly fire
+    GeoTIFF files, which is a sibling of the folder (e.g.
+    MOD14A2/prepared.events.npz).
+    :param folder:  path to the folder with the GeoTIFF files
+    :return:        path to the store
+    """
+    return f'{os.path.abspath(folder)}.events.npz'
 
 
-def doy_to_month(year, doy):
+def get_fire_pixels(events, start=None, end=None):
     """
-    Converts a three-digit string with the day of the year to a two-digit
-    string representing the month. Takes into account leap years.
-    :param year: four-digit year
-    :param doy:  three-digit day of the year
-    :return:     two-digit string month
+    Gets the pixels with at least one fire between two dates along with
+    their total number of fires.
+    :param events:  dictionary returned by read_fire_events
+    :param start:   first date (see get_fire_events)
+    :param end:     last date (see get_fire_events)
+    :return:        tuple with the rows, columns and number of fires of
+                    every pixel, sorted by row and column
     """
-    dt = datetime.datetime.strptime(f'{year} {doy}', '%Y %j')
-    return dt.strftime('%m')
+    _, rows, cols, counts = get_fire_events(events, start, end)
+    n_cols = int(events['shape'][1])
+    flat, inverse = np.unique(rows.astype(np.int64) * n_cols + cols,
+                              return_inverse=True)
+    counts = np.bincount(inverse, weights=counts, minlength=len(flat))
+
+    return flat // n_cols, flat % n_cols, counts.astype(np.int64)
+
+
+def get_fire_validity(events, year):
+    """
+    Gets the mask of the pixels with at least one valid (not NoData) value
+    during a year.
+    :param events:  dictionary returned by read_fire_events
+    :param year:    year (int or str)
+    :return:        2D boolean array
+    """
+    i = np.searchsorted(events['years'], int(year))
+    if i == len(events['years']) or events['years'][i] != int(year):
+        raise Exception(f'No fire data found for {year}.')
+
+    return np.unpackbits(events['valid'][i], axis=-1,
+                         count=int(events['shape'][1])).view(bool)
 
 
 def get_nodata_value(folder):
     """
     Gets the NoData value from the first GeoTIFF file found on the folder
-    parameter.
+    parameter (see get_raster_info).
     :param folder: path to the folder with the GeoTIFF files
     :return:       NoData value
     """
-    fn = glob.glob(os.path.join(folder, '*.tif'))[0]
-    ds = gdal.Open(fn, 0)
-    nd = ds.GetRasterBand(1).GetNoDataValue()
-    del ds
+    return get_raster_info(folder)['nodata']
+
+
+def get_overview_levels(shape, block_size=tif_block_size):
+    """
+    Gets the overview levels (powers of 2) needed until the smallest overview
+    fits in a single tile.
+    :param shape:       shape of the 2D array
+    :param block_size:  width and height of the tiles
+    :return:            list of overview levels
+    """
+    levels = []
+    level = 2
+    while max(shape) / (level / 2) > block_size:
+        levels.append(level)
+        level *= 2
+
+    return levels
+
+
+def get_raster_info(path):
+    """
+    Gets the metadata of a raster file or of the first GeoTIFF file (sorted by
+    name) of a folder. Metadata is read only once and cached in memory until
+    the file (or the folder) is modified.
+    :param path:    path to the raster file or folder
+    :return:        dictionary with the nodata, geotransform, projection,
+                    shape (rows, cols) and dtype keys
+    """
+    path = os.path.abspath(path)
+    mtime = os.stat(path).st_mtime_ns
+    cached = raster_info_cache.get(path)
+
+    # folders cache the name of their first file
+    if os.path.isdir(path):
+        if cached is None or cached[0] != mtime:
+            filenames = sorted(glob.glob(os.path.join(path, '*.tif')))
+            if not filenames:
+                raise Exception(f'No GeoTIFF files found in {path}.')
+            cached = raster_info_cache[path] = (mtime, filenames[0])
+        return get_raster_info(cached[1])
+
+    if cached is None or cached[0] != mtime:
+        ds = gdal.Open(path, 0)
+        info = {'nodata': ds.GetRasterBand(1).GetNoDataValue(),
+                'geotransform': ds.GetGeoTransform(),
+                'projection': ds.GetProjection(),
+                'shape': (ds.RasterYSize, ds.RasterXSize),
+                'dtype': ds.ReadAsArray(0, 0, 1, 1).dtype}
+        del ds
+        cached = raster_info_cache[path] = (mtime, info)
+
+    return cached[1]
+
 
-    return nd
+def get_warp_options(threads=warp_threads, memory_mb=warp_memory_mb):
+    """
+    Gets the gdal.Warp keyword arguments that enable multithreaded warping.
+    :param threads:     number of threads (or 'ALL_CPUS')
+    :param memory_mb:   working memory available to the warper in megabytes
+    :return:            dictionary with gdal.Warp keyword arguments
+    """
+    return {
+        'multithread': True,
+        'warpOptions': [f'NUM_THREADS={threads}'],
+        'warpMemoryLimit': memory_mb * 1024 * 1024
+    }
 
 
 def init_sns():
@@ -145,3 +725,300 @@ def init_sns():
     """
     sns.set_context('paper')
     sns.set_style('white')
+
+
+def is_float(gdtype):
+    """
+    Checks if a GDAL data type is a floating point data type.
+    :param gdtype:  GDAL data type
+    :return:        True if gdtype is a floating point data type
+    """
+    return gdtype in (gdal.GDT_Float32, gdal.GDT_Float64, gdal.GDT_CFloat32,
+                      gdal.GDT_CFloat64)
+
+
+def iter_blocks(ds, block_size=tif_block_size):
+    """
+    Yields the windows needed to cover a raster. Windows are aligned to the
+    raster's natural blocks (tiles or strips) and group as many of them as
+    needed to reach the block_size parameter in each dimension.
+    :param ds:          gdal.Dataset object
+    :param block_size:  minimum width and height of the windows (when the
+                        raster is big enough)
+    :return:            generator of (xoff, yoff, xsize, ysize) tuples
+    """
+    bx, by = ds.GetRasterBand(1).GetBlockSize()
+    x_step = bx * max(1, block_size // bx)
+    y_step = by * max(1, block_size // by)
+    for yoff in range(0, ds.RasterYSize, y_step):
+        ysize = min(y_step, ds.RasterYSize - yoff)
+        for xoff in range(0, ds.RasterXSize, x_step):
+            xsize = min(x_step, ds.RasterXSize - xoff)
+            yield xoff, yoff, xsize, ysize
+
+
+def open_datacube(folder, filenames=None):
+    """
+    Opens the Zarr store of a folder with GeoTIFF files as a lazy DataArray,
+    only if it was built from the folder's current files.
+    :param folder:      path to the folder with the GeoTIFF files
+    :param filenames:   list of the folder's GeoTIFF files sorted by date. If
+                        None, they are taken from the folder's catalog
+    :return:            xarray.core.dataarray.DataArray object (None if the
+                        store does not exist or is outdated)
+    """
+    path = get_datacube_path(folder)
+    if not os.path.exists(path):
+        return None
+
+    if filenames is None:
+        filenames = [entry['path'] for entry in get_catalog(folder)]
+    cube = xr.open_zarr(path, consolidated=True)['data']
+    if cube.attrs.get('sources') != fingerprint_files(filenames):
+        return None
+
+    return cube
+
+
+def process_blocks(func, src, dst, gdtype, nd_val=None,
+                   block_size=tif_block_size, options=None, lazy=False):
+    """
+    Applies a function window by window to one or more aligned rasters and
+    writes the results to a new GeoTIFF, so only a window of every raster is
+    in memory at a time (or only a window of one raster if lazy is True and
+    func consumes the arrays one at a time). The output has the grid of the
+    first raster.
+    :param func:        function that takes a list (or a generator if lazy is
+                        True) with one 2D numpy array per input raster and
+                        returns a 2D numpy array
+    :param src:         list of input raster filenames
+    :param dst:         output GeoTIFF's file name
+    :param gdtype:      output GDAL data type
+    :param nd_val:      output GeoTIFF's NoData value
+    :param block_size:  minimum width and height of the windows
+    :param options:     list of GeoTIFF creation options
+    :param lazy:        whether to pass func a generator that reads the
+                        window of each raster when it is consumed
+    :return:            output GeoTIFF's file name
+    """
+    # create output TIFF with the grid of the first raster
+    ds = gdal.Open(src[0], 0)
+    out_tif = create_tif(dst, ds.RasterXSize, ds.RasterYSize,
+                         ds.GetProjection(), ds.GetGeoTransform(), gdtype,
+                         nd_val, options)
+    del ds
+
+    # compute and write every window
+    band = out_tif.GetRasterBand(1)
+    for window, arrays in read_blocks(src, block_size, lazy):
+        band.WriteArray(func(arrays), window[0], window[1])
+
+    # flush to disk
+    band.FlushCache()
+    del out_tif, band
+
+    return dst
+
+
+def read_aoi_mask(path, gt):
+    """
+    Reads a rasterized AOI (see get_aoi_mask) as a Boolean mask of the pixels
+    of a raster grid that fall inside the AOI, along with the window of the
+    grid that it covers.
+    :param path:    path to the rasterized AOI
+    :param gt:      geotransform of the grid
+    :return:        tuple with the 2D Boolean numpy array and the window as
+                    (xoff, yoff, xsize, ysize)
+    """
+    mask_ds = gdal.Open(path, 0)
+    mask_gt = mask_ds.GetGeoTransform()
+    xoff = int(round((mask_gt[0] - gt[0]) / gt[1]))
+    yoff = int(round((mask_gt[3] - gt[3]) / gt[5]))
+    window = (xoff, yoff, mask_ds.RasterXSize, mask_ds.RasterYSize)
+    mask = mask_ds.ReadAsArray().astype(np.bool_)
+    del mask_ds
+
+    return mask, window
+
+
+def read_blocks(src, block_size=tif_block_size, lazy=False):
+    """
+    Reads one or more aligned rasters window by window (see iter_blocks).
+    :param src:         list of raster filenames with the same size
+    :param block_size:  minimum width and height of the windows
+    :param lazy:        whether to read the window of each raster only when
+                        arrays is consumed instead of all of them at once
+    :return:            generator of (window, arrays) tuples, where arrays is
+                        a list (or a generator if lazy is True) with one 2D
+                        numpy array per raster
+    """
+    datasets = [gdal.Open(fn, 0) for fn in src]
+    sizes = set((ds.RasterXSize, ds.RasterYSize) for ds in datasets)
+    if len(sizes) > 1:
+        raise Exception('Rasters do not have the same size.')
+
+    bands = [ds.GetRasterBand(1) for ds in datasets]
+    for window in iter_blocks(datasets[0], block_size):
+        arrays = (band.ReadAsArray(*window) for band in bands)
+        yield window, arrays if lazy else list(arrays)
+
+    del datasets, bands
+
+
+def read_fire_events(folder):
+    """
+    Reads the fire events store of a folder with monthly fire GeoTIFF files,
+    building it first if it does not exist or is outdated (see
+    build_fire_events).
+    :param folder:  path to the folder with the GeoTIFF files
+    :return:        dictionary with the store's arrays
+    """
+    path = build_fire_events(folder)
+    with np.load(path) as events:
+        return dict(events)
+
+
+def read_manifest(folder):
+    """
+    Reads the download manifest of a product folder. The manifest maps every
+    downloaded file name to its file id, name, size and sha256 checksum.
+    :param folder:  path to the product folder
+    :return:        dictionary with the manifest entries
+    """
+    path = os.path.join(folder, 'manifest.json')
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def read_rasters(filenames, window=None):
+    """
+    Reads a window (or the whole extent) of several GeoTIFF files with the
+    same size and stacks them.
+    :param filenames:   list of GeoTIFF filenames
+    :param window:      window as (xoff, yoff, xsize, ysize). If None, the
+                        whole extent is read
+    :return:            3D numpy array
+    """
+    data = []
+    for fn in filenames:
+        ds = gdal.Open(fn, 0)
+        data.append(ds.ReadAsArray(*(window or ())))
+        del ds
+
+    return np.stack(data)
+
+
+def reclassify(arr, mapping, dtype=np.uint8, block_rows=None, out=None):
+    """
+    Reclassifies a categorical (non-negative integer) array using a lookup
+    table built from a mapping, which takes a single indexing pass over the
+    array. Values that are not in the mapping (e.g. NoData) keep their
+    original value, so they must fit in the output data type.
+    :param arr:         numpy array (or numpy.memmap)
+    :param mapping:     dictionary mapping original values to new values
+    :param dtype:       output data type
+    :param block_rows:  number of rows to reclassify at a time. If None, the
+                        whole array is reclassified at once
+    :param out:         array (or numpy.memmap) to store the output in
+    :return:            numpy array
+    """
+    # build an identity lookup table that covers every possible value
+    if np.issubdtype(arr.dtype, np.integer) and arr.dtype.itemsize <= 2:
+        size = np.iinfo(arr.dtype).max + 1
+    else:
+        size = int(arr.max()) + 1
+    size = max(size, max(mapping) + 1)
+    lut = np.arange(size)
+    lut[list(mapping.keys())] = list(mapping.values())
+    lut = lut.astype(dtype)
+
+    if out is None:
+        out = np.empty(arr.shape, dtype)
+    if block_rows is None:
+        block_rows = arr.shape[0]
+    for i in range(0, arr.shape[0], block_rows):
+        np.take(lut, arr[i:i + block_rows], out=out[i:i + block_rows])
+
+    return out
+
+
+def run_parallel(func, jobs, workers=process_workers):
+    """
+    Runs a function for several jobs using a pool of processes configured
+    with configure_gdal and reports how long each job took.
+    :param func:    module-level function to run
+    :param jobs:    list of argument tuples. The first argument is used to
+                    identify the job in the report (e.g. a filename)
+    :param workers: number of processes. If None, all the available CPU cores
+                    are used
+    :return:        list of (job, result, seconds) tuples sorted by seconds
+                    in descending order
+    """
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=configure_gdal) as executor:
+        futures = {executor.submit(timed_call, func, *job): job
+                   for job in jobs}
+        for i, future in enumerate(as_completed(futures), 1):
+            job = futures[future]
+            result, seconds = future.result()
+            results.append((job, result, seconds))
+            print(f'[{i}/{len(futures)}] {job[0]}: {seconds:.2f} s')
+
+    total = time.perf_counter() - start
+    print(f'{len(results)} jobs finished in {total:.2f} s')
+
+    return sorted(results, key=lambda x: x[2], reverse=True)
+
+
+def timed_call(func, *args):
+    """
+    Calls a function and measures how long it took.
+    :param func:    function to call
+    :param args:    arguments passed to the function
+    :return:        tuple with the function's result and the elapsed seconds
+    """
+    start = time.perf_counter()
+    result = func(*args)
+
+    return result, time.perf_counter() - start
+
+
+def update_manifest(folder, entry):
+    """
+    Adds (or replaces) an entry of the download manifest of a product folder.
+    The manifest is written to a temporary file and then renamed so it is
+    never left half written.
+    :param folder:  path to the product folder
+    :param entry:   dictionary with the file_id, file_name, size and sha256
+                    keys
+    :return:        None
+    """
+    with manifest_lock:
+        manifest = read_manifest(folder)
+        manifest[entry['file_name']] = entry
+        path = os.path.join(folder, 'manifest.json')
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(f'{path}.tmp', path)
+
+
+def verify_manifest(folder):
+    """
+    Checks the files listed in the download manifest of a product folder
+    against their recorded size and sha256 checksum.
+    :param folder:  path to the product folder
+    :return:        list with the names of the missing or corrupted files
+    """
+    bad = []
+    for fn, entry in read_manifest(folder).items():
+        path = os.path.join(folder, fn)
+        if (not os.path.exists(path) or
+                os.path.getsize(path) != entry['size'] or
+                file_checksum(path) != entry['sha256']):
+            bad.append(fn)
+
+    return bad
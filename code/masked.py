@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# =============================================================================
+# Date:     October, 2026
+# Author:   Marcelo Villa P.
+# Purpose:  Contains a NoData-aware xarray accessor (DataArray.masked) for the
+#           (t, y, x) DataArrays created by code.functions.create_data_array.
+# Notes:    Pixels equal to the DataArray's nodata attribute, or to any of the
+#           values of its invalid attribute (e.g. 0 for Non-Flammable land
+#           cover or non-fire pixels), are not valid. The validity mask of
+#           each time slice is computed the first time it is needed and kept
+#           bit-packed (8 pixels per byte) by the accessor of the whole
+#           DataArray, so selections should be made through the accessor's
+#           methods (e.g. data.masked.select(year)) instead of .loc to reuse
+#           it.
+# =============================================================================
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+
+@xr.register_dataarray_accessor('masked')
+class MaskedAccessor:
+    """
+    NoData-aware selections and reductions with cached validity masks.
+    :param obj: xarray.core.dataarray.DataArray object with t, y and x
+                dimensions
+    """
+    def __init__(self, obj):
+        self._obj = obj
+        self._packed = {}
+
+    @property
+    def nodata(self):
+        """
+        NoData value (None if the DataArray has no NoData value).
+        """
+        return self._obj.attrs.get('nodata')
+
+    @property
+    def invalid(self):
+        """
+        Values that are not valid besides the NoData value.
+        """
+        return tuple(self._obj.attrs.get('invalid', ()))
+
+    def positions(self, key=None):
+        """
+        Gets the positions in the t dimension selected by a label, a list of
+        labels or a slice of labels, the same way .loc does.
+        :param key: label, list or slice of labels. If None, every position
+                    is selected
+        :return:    tuple with a 1D array of positions and whether the key
+                    selects a single label
+        """
+        index = self._obj.indexes['t']
+        if key is None:
+            return np.arange(len(index)), False
+
+        if isinstance(key, slice):
+            loc = index.slice_indexer(key.start, key.stop)
+        elif isinstance(key, (list, np.ndarray, pd.Index)):
+            loc = index.get_indexer(key)
+            if (loc < 0).any():
+                raise KeyError(key)
+        else:
+            loc = index.get_loc(key)
+
+        single = isinstance(loc, (int, np.integer))
+        return np.atleast_1d(np.arange(len(index))[loc]), single
+
+    def _mask(self, i, arr=None):
+        """
+        Gets the validity mask of a single time slice, computing and caching
+        it if it is not cached yet.
+        :param i:   position in the t dimension
+        :param arr: values of the time slice (read if None and needed)
+        :return:    2D boolean array
+        """
+        x_size = self._obj.sizes['x']
+        if i in self._packed:
+            return np.unpackbits(self._packed[i], axis=-1,
+                                 count=x_size).view(bool)
+
+        if arr is None:
+            arr = self._obj[i].values
+        mask = np.ones(arr.shape, bool)
+        for val in self.invalid + (self.nodata,):
+            if val is not None:
+                mask &= (arr != val)
+        self._packed[i] = np.packbits(mask, axis=-1)
+
+        return mask
+
+    def select(self, key=None):
+        """
+        Gets the values and validity mask of a selection.
+        :param key: label, list or slice of labels in the t dimension
+        :return:    tuple with the values and the boolean validity mask (2D
+                    if key is a single label, 3D otherwise)
+        """
+        positions, single = self.positions(key)
+        values = self._obj.isel(t=positions).values
+        mask = np.stack([self._mask(i, arr)
+                         for i, arr in zip(positions, values)])
+        if single:
+            return values[0], mask[0]
+
+        return values, mask
+
+    def valid(self, key=None):
+        """
+        Gets the validity mask of a selection. Values are only read for the
+        time slices whose mask is not cached yet.
+        :param key: label, list or slice of labels in the t dimension
+        :return:    boolean validity mask (2D if key is a single label, 3D
+                    otherwise)
+        """
+        positions, single = self.positions(key)
+        mask = np.stack([self._mask(i) for i in positions])
+        if single:
+            return mask[0]
+
+        return mask
+
+    def stats(self, key=None):
+        """
+        Computes the sum, number and mean of the valid pixels of every time
+        slice of a selection, one time slice at a time.
+        :param key: label, list or slice of labels in the t dimension
+        :return:    pandas.DataFrame with the sum, count and mean columns
+                    indexed by the t labels
+        """
+        positions, _ = self.positions(key)
+        sums = np.zeros(len(positions))
+        counts = np.zeros(len(positions), np.int64)
+        for j, i in enumerate(positions):
+            arr = self._obj[i].values
+            mask = self._mask(i, arr)
+            sums[j] = arr.sum(where=mask, dtype=np.float64)
+            counts[j] = np.count_nonzero(mask)
+
+        index = self._obj.indexes['t'][positions]
+        df = pd.DataFrame({'sum': sums, 'count': counts}, index=index)
+        df['mean'] = df['sum'] / df['count']
+
+        return df
+
+    def sum(self, key=None):
+        """
+        Sums the valid pixels of every time slice of a selection.
+        :param key: label, list or slice of labels in the t dimension
+        :return:    pandas.Series indexed by the t labels
+        """
+        return self.stats(key)['sum']
+
+    def count(self, key=None):
+        """
+        Counts the valid pixels of every time slice of a selection. Values
+        are only read for the time slices whose mask is not cached yet.
+        :param key: label, list or slice of labels in the t dimension
+        :return:    pandas.Series indexed by the t labels
+        """
+        positions, _ = self.positions(key)
+        counts = [np.count_nonzero(self._mask(i)) for i in positions]
+
+        return pd.Series(counts, index=self._obj.indexes['t'][positions])
+
+    def mean(self, key=None):
+        """
+        Averages the valid pixels of every time slice of a selection.
+        :param key: label, list or slice of labels in the t dimension
+        :return:    pandas.Series indexed by the t labels
+        """
+        return self.stats(key)['mean']
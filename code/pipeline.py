@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+# =============================================================================
+# Date:     October, 2026
+# Author:   Marcelo Villa P.
+# Purpose:  Runs the project's scripts as an incremental pipeline. Each stage
+#           declares the data it reads and writes, and only the stages whose
+#           inputs (or script) changed since their last successful run, or
+#           whose outputs are missing or were modified, are run again.
+#           Independent stages are run in parallel.
+# Notes:    Paths of inputs and outputs are relative to the data folder.
+#           Stages depend on every stage whose outputs contain one of their
+#           inputs. Inputs are fingerprinted by file size and modification
+#           time (or by content with --hash) and the fingerprints of the last
+#           successful run of each stage are stored in
+#           data/json/pipeline_state.json. The outputs of a stale stage are
+#           removed before it runs, so the scripts' own "already exists"
+#           checks do not keep outdated files. Download stages need network
+#           access and Earthdata credentials, so they only run when --download
+#           is given and their outputs are never removed. Run it from the
+#           repository root as: python -m code.pipeline [stages] [options]
+#           Figures are written outside of the data folder (../figures).
+# =============================================================================
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+code_dir = os.path.dirname(os.path.abspath(__file__))
+root_dir = os.path.dirname(code_dir)
+data_dir = os.path.join(root_dir, 'data')
+state_fn = os.path.join(data_dir, 'json', 'pipeline_state.json')
+
+# modules shared by every script
+shared = ['functions.py', 'variables.py', 'appeears.py', 'masked.py']
+
+stages = [
+    # download data
+    {'name': 'create_appears_tasks', 'download': True,
+     'script': '01_download_data/01_create_appears_tasks.py',
+     'inputs': ['json/geo/COL.json'],
+     'outputs': ['json/appeears_tasks']},
+    {'name': 'download_appears_tasks', 'download': True,
+     'script': '01_download_data/02_download_appears_tasks.py',
+     'inputs': ['json/appeears_tasks'],
+     'outputs': ['tif/MODIS/MOD14A2/original', 'tif/MODIS/MCD12Q1/original',
+                 'tif/MODIS/MOD44B/original', 'tif/MODIS/MOD13A3/original']},
+    {'name': 'download_trmm_data', 'download': True,
+     'script': '01_download_data/03_download_trmm_data.py',
+     'inputs': ['txt'],
+     'outputs': ['hdf/TRMM/3B43/original']},
+
+    # data wrangling
+    {'name': 'group_fires',
+     'script': '02_data_wrangling/01_group_fires.py',
+     'inputs': ['tif/MODIS/MOD14A2/original'],
+     'outputs': ['tif/MODIS/MOD14A2/preprocessed']},
+    {'name': 'reclass_landcover',
+     'script': '02_data_wrangling/02_reclass_landcover.py',
+     'inputs': ['tif/MODIS/MCD12Q1/original'],
+     'outputs': ['tif/MODIS/MCD12Q1/preprocessed']},
+    {'name': 'extract_trmm_data',
+     'script': '02_data_wrangling/03_extract_trmm_data.py',
+     'inputs': ['hdf/TRMM/3B43/original'],
+     'outputs': ['tif/TRMM/3B43/preprocessed']},
+    {'name': 'resample',
+     'script': '02_data_wrangling/04_resample.py',
+     'inputs': ['tif/MODIS/MOD14A2/original', 'tif/MODIS/MCD12Q1/preprocessed',
+                'tif/MODIS/MOD13A3/original', 'tif/MODIS/MOD14A2/preprocessed',
+                'tif/TRMM/3B43/preprocessed', 'shp/aoi'],
+     'outputs': ['tif/MODIS/MCD12Q1/resampled', 'tif/MODIS/MOD13A3/resampled',
+                 'tif/MODIS/MOD14A2/resampled', 'tif/TRMM/3B43/resampled']},
+    {'name': 'mask',
+     'script': '02_data_wrangling/05_mask.py',
+     'inputs': ['tif/MODIS/MCD12Q1/resampled', 'tif/MODIS/MOD13A3/resampled',
+                'tif/MODIS/MOD14A2/resampled', 'tif/TRMM/3B43/resampled',
+                'shp/aoi'],
+     'outputs': ['tif/MODIS/MCD12Q1/prepared', 'tif/MODIS/MOD13A3/prepared',
+                 'tif/MODIS/MOD14A2/prepared', 'tif/TRMM/3B43/prepared']},
+    {'name': 'build_datacubes',
+     'script': '02_data_wrangling/06_build_datacubes.py',
+     'inputs': ['tif/MODIS/MCD12Q1/prepared', 'tif/MODIS/MOD13A3/prepared',
+                'tif/MODIS/MOD14A2/prepared', 'tif/TRMM/3B43/prepared'],
+     'outputs': ['tif/MODIS/MCD12Q1/prepared.zarr',
+                 'tif/MODIS/MOD13A3/prepared.zarr',
+                 'tif/MODIS/MOD14A2/prepared.zarr',
+                 'tif/TRMM/3B43/prepared.zarr',
+                 'tif/MODIS/MOD14A2/prepared.events.npz']},
+
+    # create datasets
+    {'name': 'groupby_area',
+     'script': '03_create_datasets/01_groupby_area.py',
+     'inputs': ['tif/MODIS/MOD14A2/prepared',
+                'tif/MODIS/MOD14A2/prepared.zarr',
+                'tif/MODIS/MOD13A3/prepared',
+                'tif/MODIS/MOD13A3/prepared.zarr',
+                'tif/TRMM/3B43/prepared',
+                'tif/TRMM/3B43/prepared.zarr'],
+     'outputs': ['csv/groupby_area.csv']},
+    {'name': 'landcover_per_fire_pixel',
+     'script': '03_create_datasets/02_landcover_per_fire_pixel.py',
+     'inputs': ['tif/MODIS/MOD14A2/prepared',
+                'tif/MODIS/MOD14A2/prepared.events.npz',
+                'tif/MODIS/MCD12Q1/prepared',
+                'tif/MODIS/MCD12Q1/prepared.zarr'],
+     'outputs': ['csv/landcover_per_fire_pixel.csv']},
+    {'name': 'landcover_normalized_area',
+     'script': '03_create_datasets/03_landcover_normalized_area.py',
+     'inputs': ['tif/MODIS/MCD12Q1/prepared',
+                'tif/MODIS/MCD12Q1/prepared.zarr'],
+     'outputs': ['csv/landcover_normalized_area.csv']},
+    {'name': 'fire_pixels_proportion_per_landcover',
+     'script': '03_create_datasets/04_fire_pixels_proportion_per_landcover.py',
+     'inputs': ['tif/MODIS/MOD14A2/prepared',
+                'tif/MODIS/MOD14A2/prepared.events.npz',
+                'tif/MODIS/MCD12Q1/prepared',
+                'tif/MODIS/MCD12Q1/prepared.zarr'],
+     'outputs': ['csv/fire_pixels_proportion_per_landcover.csv']},
+    {'name': 'distance_to_nearest_forest',
+     'script': '03_create_datasets/05_distance_to_nearest_forest.py',
+     'inputs': ['tif/MODIS/MCD12Q1/prepared'],
+     'outputs': ['tif/MODIS/derived/DTNF', 'tif/MODIS/derived/DTNF.zarr']},
+    {'name': 'landcover_and_forest_proximity_per_pixel',
+     'script': '03_create_datasets/'
+               '06_landcover_and_forest_proximity_per_pixel.py',
+     'inputs': ['tif/MODIS/MOD14A2/prepared',
+                'tif/MODIS/MOD14A2/prepared.events.npz',
+                'tif/MODIS/MCD12Q1/prepared',
+                'tif/MODIS/MCD12Q1/prepared.zarr',
+                'tif/MODIS/derived/DTNF',
+                'tif/MODIS/derived/DTNF.zarr'],
+     'outputs': ['csv/landcover_and_forest_proximity_per_pixel.csv']},
+
+    # plots
+    {'name': 'fire_ppt_evi_time_series',
+     'script': '04_plots/01_fire_ppt_evi_time_series.py',
+     'inputs': ['csv/groupby_area.csv'],
+     'outputs': ['../figures/graph/fire_ppt_evi_time_series.eps']},
+    {'name': 'fire_per_landcover_boxplot',
+     'script': '04_plots/02_fire_per_landcover_boxplot.py',
+     'inputs': ['csv/fire_pixels_proportion_per_landcover.csv'],
+     'outputs': ['../figures/graph/fire_per_landcover_boxplot.eps']},
+    {'name': 'ppt_evi_kde',
+     'script': '04_plots/03_ppt_evi_kde.py',
+     'inputs': ['tif/MODIS/MOD14A2/prepared',
+                'tif/MODIS/MOD14A2/prepared.events.npz',
+                'tif/MODIS/MOD13A3/prepared',
+                'tif/MODIS/MOD13A3/prepared.zarr',
+                'tif/TRMM/3B43/prepared',
+                'tif/TRMM/3B43/prepared.zarr'],
+     'outputs': ['../figures/graph/ppt_evi_kde.pdf']},
+    {'name': 'distance_to_nearest_forest_hist',
+     'script': '04_plots/04_distance_to_nearest_forest_hist.py',
+     'inputs': ['tif/MODIS/MOD14A2/prepared',
+                'tif/MODIS/MOD14A2/prepared.events.npz',
+                'tif/MODIS/derived/DTNF',
+                'tif/MODIS/derived/DTNF.zarr'],
+     'outputs': ['../figures/graph/distance_to_nearest_forest_hist.pdf']},
+    {'name': 'landcover_treemap',
+     'script': '04_plots/05_landcover_treemap.py',
+     'inputs': ['csv/landcover_normalized_area.csv'],
+     'outputs': ['../figures/graph/landcover_treemap.eps']},
+    {'name': 'ppt_evi_correlation',
+     'script': '04_plots/06_ppt_evi_correlation.py',
+     'inputs': ['csv/groupby_area.csv'],
+     'outputs': ['../figures/graph/ppt_evi_correlation.eps']},
+    {'name': 'distance_by_landcover_reg',
+     'script': '04_plots/07_distance_by_landcover_reg.py',
+     'inputs': ['csv/landcover_and_forest_proximity_per_pixel.csv'],
+     'outputs': ['../figures/graph/distance_by_landcover_reg.pdf']},
+]
+
+
+def contains(parent, path):
+    """
+    Checks if a path is equal to or inside another path.
+    :param parent:  parent path
+    :param path:    path to check
+    :return:        True if path is equal to or inside parent
+    """
+    return path == parent or path.startswith(parent.rstrip('/') + '/')
+
+
+def fingerprint(paths, base, content=False):
+    """
+    Fingerprints a set of files and folders (recursively) by their relative
+    path, size and modification time, or by their content.
+    :param paths:   list of paths relative to base
+    :param base:    base folder of the paths
+    :param content: whether to hash the files' content instead of using their
+                    size and modification time
+    :return:        hex digest (None if one of the paths does not exist)
+    """
+    h = hashlib.sha256()
+    for path in sorted(paths):
+        full_path = os.path.join(base, path)
+        if not os.path.exists(full_path):
+            return None
+
+        # list every file (a single one if path is not a folder)
+        if os.path.isdir(full_path):
+            filenames = sorted(os.path.join(d, fn)
+                               for d, _, fns in os.walk(full_path)
+                               for fn in fns)
+        else:
+            filenames = [full_path]
+
+        for fn in filenames:
+            h.update(os.path.relpath(fn, base).encode())
+            if content:
+                with open(fn, 'rb') as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b''):
+                        h.update(chunk)
+            else:
+                stat = os.stat(fn)
+                h.update(f'{stat.st_size}{stat.st_mtime_ns}'.encode())
+
+    return h.hexdigest()
+
+
+def get_dependencies(stage):
+    """
+    Gets the names of the stages whose outputs contain one of the inputs of a
+    given stage.
+    :param stage:   stage dictionary
+    :return:        set of stage names
+    """
+    deps = set()
+    for other in stages:
+        if other is stage:
+            continue
+        for inp in stage['inputs']:
+            if any(contains(out, inp) for out in other['outputs']):
+                deps.add(other['name'])
+
+    return deps
+
+
+def get_fingerprints(stage, content=False):
+    """
+    Fingerprints the inputs (including the stage's script and the shared
+    modules) and the outputs of a stage.
+    :param stage:   stage dictionary
+    :param content: whether to hash the data files' content
+    :return:        tuple with the inputs and outputs fingerprints
+    """
+    code = fingerprint([stage['script']] + shared, code_dir, content=True)
+    inputs = fingerprint(stage['inputs'], data_dir, content)
+    outputs = fingerprint(stage['outputs'], data_dir, content)
+
+    return f'{code}{inputs}', outputs
+
+
+def run_stage(stage):
+    """
+    Runs the script of a stage from the script's folder (as the scripts use
+    paths relative to it) with the repository root in the Python path.
+    :param stage:   stage dictionary
+    :return:        script's return code
+    """
+    script = os.path.join(code_dir, stage['script'])
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        filter(None, [root_dir, env.get('PYTHONPATH')]))
+    r = subprocess.run([sys.executable, os.path.basename(script)],
+                       cwd=os.path.dirname(script), env=env)
+
+    return r.returncode
+
+
+def run_pipeline(names=None, workers=2, force=False, download=False,
+                 content=False, dry_run=False):
+    """
+    Runs every stale stage (and the stale stages they depend on) making sure
+    every stage runs after its dependencies.
+    :param names:       names of the stages to run. If None, every stage is
+                        considered
+    :param workers:     number of stages to run in parallel
+    :param force:       whether to run the stages even if they are not stale
+    :param download:    whether to consider the download stages
+    :param content:     whether to fingerprint the data files' content
+    :param dry_run:     whether to only print the stale stages
+    :return:            list with the names of the failed stages
+    """
+    state = {}
+    if os.path.exists(state_fn):
+        with open(state_fn) as f:
+            state = json.load(f)
+
+    # select stages and their dependencies
+    by_name = {stage['name']: stage for stage in stages}
+    for name in names or []:
+        if name not in by_name:
+            raise Exception(f'Unknown stage: {name}.')
+    deps = {stage['name']: get_dependencies(stage) for stage in stages}
+    selected = set(names or by_name)
+    pending = list(selected)
+    while pending:
+        for dep in deps[pending.pop()]:
+            if dep not in selected:
+                selected.add(dep)
+                pending.append(dep)
+    if not download:
+        selected = {n for n in selected if not by_name[n].get('download')}
+    deps = {n: deps[n] & selected for n in selected}
+
+    done = set()
+    stale_deps = set()  # stages reported as stale during a dry run
+    failed = []
+    running = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while len(done) + len(failed) < len(selected):
+            # stages whose dependencies failed cannot run
+            for name in selected - done - set(failed) - set(running.values()):
+                if deps[name] & set(failed):
+                    print(f'{name}: skipped (a dependency failed).')
+                    failed.append(name)
+
+            # start every stage whose dependencies are done
+            ready = [n for n in sorted(selected)
+                     if n not in done and n not in failed and
+                     n not in running.values() and deps[n] <= done]
+            for name in ready:
+                stage = by_name[name]
+                inputs, outputs = get_fingerprints(stage, content)
+                record = state.get(name, {})
+                stale = (force or outputs is None or
+                         bool(deps[name] & stale_deps) or
+                         record.get('inputs') != inputs or
+                         record.get('outputs') != outputs)
+                if not stale:
+                    print(f'{name}: up to date.')
+                    done.add(name)
+                elif dry_run:
+                    print(f'{name}: stale.')
+                    stale_deps.add(name)
+                    done.add(name)
+                else:
+                    # remove outdated outputs so the script rebuilds them
+                    if not stage.get('download'):
+                        for out in stage['outputs']:
+                            path = os.path.join(data_dir, out)
+                            if os.path.isdir(path):
+                                shutil.rmtree(path)
+                            elif os.path.exists(path):
+                                os.remove(path)
+                    print(f'{name}: running.')
+                    running[executor.submit(run_stage, stage)] = name
+
+            if not running:
+                continue
+
+            # wait for a stage to finish and record its fingerprints
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                if future.result() == 0:
+                    inputs, outputs = get_fingerprints(by_name[name], content)
+                    state[name] = {'inputs': inputs, 'outputs': outputs}
+                    os.makedirs(os.path.dirname(state_fn), exist_ok=True)
+                    with open(state_fn, 'w') as f:
+                        json.dump(state, f, indent=2, sort_keys=True)
+                    print(f'{name}: done.')
+                    done.add(name)
+                else:
+                    print(f'{name}: failed.')
+                    failed.append(name)
+
+    return failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Runs the stale stages of '
+                                                 'the pipeline.')
+    parser.add_argument('stages', nargs='*',
+                        help='stages to run (along with their dependencies)')
+    parser.add_argument('--workers', type=int, default=2,
+                        help='number of stages to run in parallel')
+    parser.add_argument('--force', action='store_true',
+                        help='run the stages even if they are up to date')
+    parser.add_argument('--download', action='store_true',
+                        help='also run the download stages')
+    parser.add_argument('--hash', action='store_true',
+                        help='fingerprint data files by content')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='only print the stale stages')
+    args = parser.parse_args()
+
+    failed = run_pipeline(args.stages or None, args.workers, args.force,
+                          args.download, args.hash, args.dry_run)
+    sys.exit(1 if failed else 0)
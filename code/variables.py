@@ -7,8 +7,28 @@
 # general
 bbox = (-78.9909352282, -4.29818694419, -66.8763258531, 12.4373031682)
 landcovers = {1: 'Forest', 2: 'Savanna', 3: 'Grassland', 4: 'Cropland'}
+umd_reclass = {0: 0, 1: 1, 2: 1, 3: 1, 4: 1, 5: 1, 6: 3, 7: 3, 8: 2, 9: 2,
+               10: 3, 11: 0, 12: 4, 13: 0, 14: 4, 15: 0}
 evi_scaling_factor = 0.0001
 
+# parallelism
+download_workers = 8
+process_workers = None  # None uses all the available CPU cores
+read_workers = 4  # files read at the same time when loading data arrays
+
+# data arrays
+data_chunks = (1, 1024, 1024)  # (t, y, x) chunks read lazily from disk
+
+# gdal
+gdal_cache_mb = 512
+warp_memory_mb = 256
+warp_threads = 2  # threads used by each warp (per process)
+
+# geotiff
+tif_compress = 'DEFLATE'  # 'ZSTD' needs GDAL >= 2.3. None disables it
+tif_block_size = 256
+tif_overviews = False  # True writes Cloud-Optimized GeoTIFFs (COG)
+
 # colors
 # edge_color = '#102027'
 edge_color = '#23373B'